@@ -1,4 +1,5 @@
 import importlib
+import os
 from pathlib import Path
 
 import streamlit as st
@@ -20,6 +21,13 @@ PAGE_MODULES = {
     "Dubber": "src.pages.dubber_page",
     "Ask AP": "src.pages.ask_ap_page",
 }
+# e.g. APP_PAGES="Ask AP" for deployments that only serve Ask AP.
+if pages := os.environ.get("APP_PAGES"):
+    names = [name.strip() for name in pages.split(",") if name.strip()]
+    if unknown := [name for name in names if name not in PAGE_MODULES]:
+        logger.error(f"Unknown APP_PAGES {unknown}, available: {list(PAGE_MODULES)}")
+        raise ValueError(f"Unknown APP_PAGES {unknown}, available: {list(PAGE_MODULES)}")
+    PAGE_MODULES = {name: PAGE_MODULES[name] for name in names}
 
 def load_page(page_name):
     try:
@@ -1,13 +1,26 @@
+import argparse
+import fcntl
 import json
 import logging
 import os
+import queue
+import threading
 import time
-from typing import Any, Dict
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 from openai import OpenAI
 
-from src.process import is_valid_output, parse_text, process_citations
-from src.utils import read
+from src.articles import load_articles
+from src.batch import JsonlStore, read_items, run_batch
+from src.citations import CitationIndex
+from src.metrics import METRICS
+from src.process import (IncrementalParser, answer_events, is_valid_output,
+                         parse_text, process_citations, replace_citations)
+from src.retrieval import RetrievalIndex
+from src.utils import normalize_question, read, write
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,105 +29,605 @@ logging.basicConfig(
 )
 LOGGER = logging.getLogger("AskAP")
 
+LOCAL_CONTEXT_INSTRUCTIONS = (
+    "Use only the passages inside <context>. Cite every quote with the "
+    "<file>...</file> tag of the passage it comes from, exactly as given."
+)
+
+
+class AnswerCache:
+    """Answers repeated questions without a run.
+
+    Lookups go exact/normalized key first, then nearest neighbour over question
+    embeddings. Entries expire ``ttl`` seconds after they were answered and the
+    least recently used ones are evicted past ``max_size``, in memory only.
+    Fresh answers are merged into ``path`` so other processes and restarts
+    see them, with each entry's creation time and embedding alongside.
+    """
+
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    SIMILARITY_THRESHOLD = 0.92
+
+    def __init__(
+        self,
+        client: OpenAI,
+        path: Optional[str] = None,
+        max_size: int = 5000,
+        ttl: Optional[float] = 30 * 24 * 3600,
+    ) -> None:
+        self.client = client
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> {"question", "answer", "created"}
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.embeddings: Dict[str, np.ndarray] = {}
+        self.matrix_keys: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        if path and os.path.exists(path):
+            self._load()
+
+    @property
+    def meta_path(self) -> str:
+        """Creation times and embeddings of the entries, next to ``path``, which
+        stays a plain question -> answer map for the tools that read it."""
+        return f"{os.path.splitext(self.path)[0]}_meta.npz"
+
+    def _read_disk(self) -> "OrderedDict[str, Dict[str, Any]]":
+        """Entries in ``path`` with their creation time and embedding (or None)."""
+        entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        if not os.path.exists(self.path):
+            return entries
+        meta: Dict[str, tuple] = {}
+        if os.path.exists(self.meta_path):
+            with np.load(self.meta_path) as data:
+                meta = {
+                    key: (created, vector if embedded else None)
+                    for key, created, embedded, vector in zip(
+                        data["keys"].tolist(), data["created"], data["embedded"], data["vectors"]
+                    )
+                }
+        # Answers saved before their metadata was kept count from the file's mtime.
+        mtime = os.path.getmtime(self.path)
+        for question, answer in read(self.path).items():
+            key = normalize_question(question)
+            created, vector = meta.get(key, (mtime, None))
+            entries[key] = {"question": question, "answer": answer, "created": float(created), "vector": vector}
+        return entries
+
+    def _load(self) -> None:
+        for key, item in self._read_disk().items():
+            entry = {"question": item["question"], "answer": item["answer"], "created": item["created"]}
+            if self._expired(entry):
+                continue
+            self.entries[key] = entry
+            if item["vector"] is not None:
+                self.embeddings[key] = item["vector"].astype(np.float32)
+        LOGGER.info(
+            f"Loaded {len(self.entries)} cached answers ({len(self.embeddings)} embedded) from {self.path}"
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, question: str) -> bool:
+        return self._get_entry(normalize_question(question)) is not None
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def _get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+        if self.embeddings.pop(key, None) is not None:
+            self.matrix = None
+
+    def _embed(self, texts: List[str], batch_size: int = 1000) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            response = self.client.embeddings.create(
+                model=self.EMBEDDING_MODEL, input=texts[i : i + batch_size]
+            )
+            vectors.extend(item.embedding for item in response.data)
+        vectors = np.array(vectors, dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def _refresh_matrix(self) -> None:
+        if self.matrix is None:
+            self.matrix_keys = list(self.embeddings)
+            self.matrix = (
+                np.stack([self.embeddings[key] for key in self.matrix_keys])
+                if self.matrix_keys
+                else None
+            )
+
+    def nearest(self, question: str) -> tuple[Optional[Dict[str, Any]], float]:
+        if not self.entries:
+            return None, 0.0
+        with self.lock:
+            missing = [key for key in self.entries if key not in self.embeddings]
+        # Embedded outside the lock so exact hits aren't held up; only entries
+        # without a stored embedding get here.
+        vectors = self._embed(missing + [normalize_question(question)])
+        query = vectors[-1]
+        with self.lock:
+            for key, vector in zip(missing, vectors):
+                if key in self.entries and key not in self.embeddings:
+                    self.embeddings[key] = vector
+                    self.matrix = None
+            self._refresh_matrix()
+            if self.matrix is None:
+                return None, 0.0
+            scores = self.matrix @ query
+            best = int(np.argmax(scores))
+            entry = self._get_entry(self.matrix_keys[best])
+            return entry, float(scores[best])
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        key = normalize_question(question)
+        with self.lock:
+            if entry := self._get_entry(key):
+                LOGGER.info(f"Cache hit (exact): {question}")
+                return entry["answer"]
+        try:
+            entry, score = self.nearest(question)
+        except Exception as e:
+            LOGGER.warning(f"Semantic cache lookup failed: {e}")
+            return None
+        if entry and score >= self.SIMILARITY_THRESHOLD:
+            LOGGER.info(f"Cache hit (similarity={score:.3f}): {question} ~ {entry['question']}")
+            return entry["answer"]
+        return None
+
+    def put(self, question: str, answer: Dict[str, Any]) -> None:
+        key = normalize_question(question)
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = {"question": question, "answer": answer, "created": time.time()}
+            for expired in [k for k, entry in self.entries.items() if self._expired(entry)]:
+                self._remove(expired)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+            self._write_back()
+
+    def _write_back(self) -> None:
+        """Merges this process's entries into ``path``, newest answer per key
+        winning, under a file lock so concurrent processes don't drop each
+        other's answers. Entries expired or evicted here stay on disk."""
+        if not self.path:
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            merged = self._read_disk()
+            for key, entry in self.entries.items():
+                if key not in merged or merged[key]["created"] <= entry["created"]:
+                    merged[key] = {**entry, "vector": self.embeddings.get(key)}
+                elif merged[key]["vector"] is None and key in self.embeddings:
+                    merged[key]["vector"] = self.embeddings[key]
+            write(self.path, {item["question"]: item["answer"] for item in merged.values()}, verbose=False)
+            keys = list(merged)
+            dims = next((len(item["vector"]) for item in merged.values() if item["vector"] is not None), 0)
+            # Half precision is plenty to rank by cosine similarity and halves the file.
+            vectors = np.zeros((len(keys), dims), dtype=np.float16)
+            for i, key in enumerate(keys):
+                if merged[key]["vector"] is not None:
+                    vectors[i] = merged[key]["vector"]
+            tmp_path = f"{self.meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    keys=np.array(keys, dtype=str),
+                    created=np.array([merged[key]["created"] for key in keys], dtype=np.float64),
+                    embedded=np.array([merged[key]["vector"] is not None for key in keys], dtype=bool),
+                    vectors=vectors,
+                )
+            os.replace(tmp_path, self.meta_path)
+
 
 class AssistantInteraction:
     MAX_RETRIES = 1
+    DEADLINE = 60.0
+    HEDGE_AFTER = 20.0
+    HEDGE_PERCENTILE = 90
+    MIN_HEDGE_SAMPLES = 20
+    POLL_INTERVAL = 0.5
+    FALLBACK_SIMILARITY = 0.8
+    CONTEXT_ARTICLES = 5
 
-    def __init__(self, assistant_id: str, md_path: str) -> None:
+    def __init__(
+        self,
+        assistant_id: str,
+        md_path: str,
+        cache_path: Optional[str] = "data/cached_answers.json",
+        index_dir: Optional[str] = None,
+    ) -> None:
         self.assistant_id = assistant_id
-        self.articles_md = read(md_path)
+        self.articles_md = load_articles(md_path)
         assert os.getenv("OPENAI_API_KEY"), "OpenAI API Key not set."
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.cache = AnswerCache(self.client, cache_path)
+        self.citations = CitationIndex(self.client, articles_md=self.articles_md)
+        self.retriever = RetrievalIndex(index_dir, self.client) if index_dir else None
         LOGGER.info(f"Initialized assistant: {self.assistant_id}")
 
+    def build_message(self, question: str) -> str:
+        if not self.retriever:
+            return question
+        with METRICS.span("ask_ap_retrieval"):
+            hits = self.retriever.search(question, k=self.CONTEXT_ARTICLES)
+        LOGGER.info(f"Retrieved context: {[hit['filename'] for hit in hits]}")
+        context = "\n\n".join(
+            f"<file>{hit['filename']}</file>\n{hit['passage']}" for hit in hits
+        )
+        return f"{question}\n\n<context>\n{context}\n</context>"
+
+    def run_options(self) -> Dict[str, Any]:
+        """With a local retriever the context is in the message, so file_search is off."""
+        if not self.retriever:
+            return {}
+        return {"tool_choice": "none", "additional_instructions": LOCAL_CONTEXT_INSTRUCTIONS}
+
     def create_thread_and_send_message(self, question: str) -> str:
-        thread_id = self.client.beta.threads.create().id
+        with METRICS.span("ask_ap_thread_create"):
+            thread_id = self.client.beta.threads.create().id
         LOGGER.info(f"Created thread: {thread_id}")
-        return {
-            "thread_id": thread_id,
-            "message_id": self.client.beta.threads.messages.create(
-                thread_id=thread_id, role="user", content=question
-            ).id,
-        }
+        content = self.build_message(question)
+        with METRICS.span("ask_ap_message_create"):
+            message_id = self.client.beta.threads.messages.create(
+                thread_id=thread_id, role="user", content=content
+            ).id
+        return {"thread_id": thread_id, "message_id": message_id}
 
-    def get_response(self, thread_id: str) -> Any:
+    def get_response(self, thread_id: str, cancel: Optional[threading.Event] = None) -> Any:
+        """Runs the assistant on the thread and returns the answer text.
+
+        Polls the run until it finishes; if ``cancel`` gets set first, the run is
+        cancelled through the API and None is returned.
+        """
         if not thread_id:
             raise ValueError("Thread ID is not set. Create a thread first.")
-        self.client.beta.threads.runs.create_and_poll(
-            assistant_id=self.assistant_id, thread_id=thread_id
-        )
-        messages = self.client.beta.threads.messages.list(thread_id=thread_id)
+        cancel = cancel or threading.Event()
+        if cancel.is_set():
+            return None
+        with METRICS.span("ask_ap_run_poll"):
+            run = self.client.beta.threads.runs.create(
+                assistant_id=self.assistant_id, thread_id=thread_id, **self.run_options()
+            )
+            while run.status in ("queued", "in_progress", "cancelling"):
+                if cancel.wait(self.POLL_INTERVAL):
+                    self.client.beta.threads.runs.cancel(run_id=run.id, thread_id=thread_id)
+                    METRICS.inc("ask_ap_cancelled_runs")
+                    LOGGER.info(f"Cancelled run: {run.id}")
+                    return None
+                run = self.client.beta.threads.runs.retrieve(run_id=run.id, thread_id=thread_id)
+        if run.status != "completed":
+            METRICS.inc("ask_ap_failed_runs")
+            LOGGER.warning(f"Run {run.id} ended with status: {run.status}")
+            return None
+        with METRICS.span("ask_ap_message_list"):
+            messages = self.client.beta.threads.messages.list(thread_id=thread_id)
         return messages.data[0].content[0].text
 
+    def stream_response(self, thread_id: str, cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        """Yields the answer text so far, with citations resolved, after every delta.
+
+        If ``cancel`` gets set, the run is cancelled through the API at the next
+        event and the stream stops.
+        """
+        cancel = cancel or threading.Event()
+        with self.client.beta.threads.runs.stream(
+            assistant_id=self.assistant_id, thread_id=thread_id, **self.run_options()
+        ) as stream:
+            run_id = None
+            for event in stream:
+                if event.event == "thread.run.created":
+                    run_id = event.data.id
+                if cancel.is_set():
+                    if run_id:
+                        self.client.beta.threads.runs.cancel(run_id=run_id, thread_id=thread_id)
+                        METRICS.inc("ask_ap_cancelled_runs")
+                        LOGGER.info(f"Cancelled run: {run_id}")
+                    return
+                if event.event != "thread.message.delta":
+                    continue
+                text = stream.current_message_snapshot.content[0].text
+                yield replace_citations(self.citations, text.value, text.annotations)
+
     def postprocess(self, output: Any) -> Dict[str, Any]:
-        process_citations(self.client, output)
-        return parse_text(output.value, self.articles_md)
+        with METRICS.span("ask_ap_process_citations"):
+            process_citations(self.citations, output)
+        with METRICS.span("ask_ap_parse_text"):
+            return parse_text(output.value, self.articles_md)
 
-    def interact(self, question: str) -> Dict[str, Any]:
-        LOGGER.info(f"Question: {question}")
+    def hedge_delay(self) -> float:
+        if METRICS.count("ask_ap_attempt_seconds") < self.MIN_HEDGE_SAMPLES:
+            return self.HEDGE_AFTER
+        return METRICS.percentile("ask_ap_attempt_seconds", self.HEDGE_PERCENTILE)
+
+    def attempt(self, question: str, cancel: threading.Event) -> Optional[Dict[str, Any]]:
+        if cancel.is_set():
+            return None
+        start = time.time()
         ids = self.create_thread_and_send_message(question)
-        final_output = {
+        output = self.get_response(ids["thread_id"], cancel)
+        if not output:
+            return None
+        METRICS.observe("ask_ap_attempt_seconds", time.time() - start)
+        LOGGER.info(f"<RAW_RESPONSE> {output.value} </RAW_RESPONSE>")
+        processed_output = self.postprocess(output)
+        LOGGER.info(
+            f"Processed response: {json.dumps(processed_output, indent=2, ensure_ascii=False)}"
+        )
+        return processed_output
+
+    def fallback(self, question: str) -> Dict[str, Any]:
+        try:
+            entry, score = self.cache.nearest(question)
+        except Exception as e:
+            LOGGER.warning(f"Fallback cache lookup failed: {e}")
+            entry, score = None, 0.0
+        METRICS.inc("ask_ap_fallbacks")
+        if entry and score >= self.FALLBACK_SIMILARITY:
+            LOGGER.info(f"Falling back to cached answer (similarity={score:.3f}): {entry['question']}")
+            return entry["answer"]
+        return {
             "header": "Please elaborate or rephrase the question.",
             "insights": [],
         }
 
-        for attempt in range(self.MAX_RETRIES + 1):
-            try:
-                output = self.get_response(ids["thread_id"])
-            except Exception as e:
-                LOGGER.error(f"Error retrieving response: {e}")
-                output = ""
-            if not output:
-                LOGGER.warning(
-                    f"No response received for question: {question}. Attempting retry {attempt + 1}/{self.MAX_RETRIES}"
-                )
-                continue
+    def interact(
+        self, question: str, use_cache: bool = True, fallback: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """Answers within ``DEADLINE`` seconds.
 
-            LOGGER.info(f"<RAW_RESPONSE> {output.value} </RAW_RESPONSE>")
-            processed_output = self.postprocess(output)
-            LOGGER.info(
-                f"Processed response: {json.dumps(processed_output, indent=2, ensure_ascii=False)}"
-            )
+        Runs are hedged: if the first run is still going after ``hedge_delay``
+        (the ``HEDGE_PERCENTILE`` of recent run latencies), or returns an invalid
+        answer, another run starts in parallel, up to ``MAX_RETRIES`` extra runs.
+        The first valid answer wins and the other runs are cancelled. Past the
+        deadline, the nearest cached answer is returned instead, or None
+        without ``fallback``.
+        """
+        with METRICS.span("ask_ap_interact"):
+            if use_cache and (cached := self.cached(question)):
+                return cached
+            return self._interact(question, fallback)
 
-            if is_valid_output(processed_output):
-                LOGGER.info(f"!Valid response!")
-                final_output = processed_output
-                break
-            else:
-                LOGGER.warning(
-                    f"Invalid response. "
-                    + (
-                        f"Retry {attempt + 1}/{self.MAX_RETRIES}"
-                        if attempt < self.MAX_RETRIES
-                        else f"Max retries reached"
+    def cached(self, question: str) -> Optional[Dict[str, Any]]:
+        with METRICS.span("ask_ap_cache_lookup"):
+            answer = self.cache.get(question)
+        METRICS.inc("ask_ap_cache_hits" if answer else "ask_ap_cache_misses")
+        return answer
+
+    def _interact(
+        self, question: str, fallback: bool = True, deadline: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        LOGGER.info(f"Question: {question}")
+        deadline = deadline or time.time() + self.DEADLINE
+        cancel = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.MAX_RETRIES + 1)
+        pending = set()
+        attempts = 0
+        next_hedge = 0.0
+        final_output = None
+        try:
+            while final_output is None:
+                now = time.time()
+                if attempts <= self.MAX_RETRIES and (not pending or now >= next_hedge):
+                    if attempts:
+                        METRICS.inc("ask_ap_retries")
+                        LOGGER.warning(
+                            f"Starting run {attempts + 1}/{self.MAX_RETRIES + 1} "
+                            f"""for question: "{question}"."""
+                        )
+                    pending.add(executor.submit(self.attempt, question, cancel))
+                    attempts += 1
+                    next_hedge = now + self.hedge_delay()
+                if not pending:
+                    LOGGER.warning(f"""Max retries reached for question: "{question}".""")
+                    break
+                if now >= deadline:
+                    METRICS.inc("ask_ap_deadline_exceeded")
+                    LOGGER.warning(
+                        f"""Deadline of {self.DEADLINE}s exceeded for question: "{question}"."""
                     )
-                    + f""" for question: "{question}"."""
-                )
-        return final_output
+                    break
+                timeout = deadline - now
+                if attempts <= self.MAX_RETRIES:
+                    timeout = min(timeout, next_hedge - now)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        LOGGER.error(f"Error retrieving response: {e}")
+                        output = None
+                    if output and is_valid_output(output):
+                        LOGGER.info(f"!Valid response!")
+                        final_output = output
+                        break
+                    METRICS.inc("ask_ap_invalid_answers")
+                    LOGGER.warning(f"""Invalid or empty response for question: "{question}".""")
+                    next_hedge = 0.0
+        finally:
+            cancel.set()
+            executor.shutdown(wait=False)
+
+        if final_output:
+            self.cache.put(question, final_output)
+            return final_output
+        return self.fallback(question) if fallback else None
+
+    def stream_interact(self, question: str, use_cache: bool = True) -> Iterator[Tuple[str, Any]]:
+        """Streaming variant of ``interact``, under the same ``DEADLINE``.
+
+        Yields ``("header", str)`` and ``("insight", dict)`` events as soon as they
+        are parsed, then ``("done", dict)`` with the final answer. If nothing has
+        streamed after ``hedge_delay``, a regular run is hedged alongside and the
+        first valid answer wins. If the stream fails partway or its answer turns
+        out invalid, ``done`` carries the result of a regular ``interact`` retry in
+        the time left; past the deadline, the fallback answer.
+        """
+        LOGGER.info(f"Question (streaming): {question}")
+        start = time.perf_counter()
+        deadline = time.time() + self.DEADLINE
+        if use_cache and (cached := self.cached(question)):
+            yield from answer_events(cached)
+            return
+        cancel = threading.Event()
+        results: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        ids = self.create_thread_and_send_message(question)
+        threading.Thread(
+            target=self._pump_stream, args=(ids["thread_id"], cancel, results), daemon=True
+        ).start()
+        streaming, hedging, hedged = True, False, 0
+        hedge_at = time.time() + self.hedge_delay()
+        parser = IncrementalParser(self.articles_md)
+        text = ""
+        first_content = True
+        try:
+            while streaming or hedging:
+                now = time.time()
+                if now >= deadline:
+                    METRICS.inc("ask_ap_deadline_exceeded")
+                    LOGGER.warning(f"""Deadline of {self.DEADLINE}s exceeded for question: "{question}".""")
+                    yield ("done", self.fallback(question))
+                    return
+                timeout = deadline - now
+                if streaming and first_content and hedged < self.MAX_RETRIES:
+                    if now >= hedge_at:
+                        METRICS.inc("ask_ap_retries")
+                        LOGGER.warning(f"""No streamed content yet, hedging a run for question: "{question}".""")
+                        threading.Thread(
+                            target=lambda: results.put(("hedge", self._hedge(question, cancel))), daemon=True
+                        ).start()
+                        hedging = True
+                        hedged += 1
+                    else:
+                        timeout = min(timeout, hedge_at - now)
+                try:
+                    kind, payload = results.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                if kind == "text":
+                    text = payload
+                    for event in parser.update(text):
+                        if first_content:
+                            METRICS.observe("ask_ap_first_content_seconds", time.perf_counter() - start)
+                            first_content = False
+                        yield event
+                elif kind == "hedge":
+                    hedging = False
+                    if payload:
+                        LOGGER.info(f"!Valid response! (hedged run)")
+                        self.cache.put(question, payload)
+                        yield ("done", payload)
+                        return
+                else:
+                    streaming = False
+                    if payload:
+                        # The text is truncated: neither cache nor return it.
+                        LOGGER.error(f"Error streaming response: {payload}")
+                        METRICS.inc("ask_ap_stream_errors")
+                    else:
+                        if text:
+                            LOGGER.info(f"<RAW_RESPONSE> {text} </RAW_RESPONSE>")
+                            METRICS.observe("ask_ap_stream_seconds", time.perf_counter() - start)
+                            processed_output = parser.close(text)
+                            if is_valid_output(processed_output):
+                                LOGGER.info(f"!Valid response!")
+                                self.cache.put(question, processed_output)
+                                yield ("done", processed_output)
+                                return
+                        METRICS.inc("ask_ap_invalid_answers")
+        finally:
+            cancel.set()
+        LOGGER.warning(f"""Invalid streamed response. Retrying for question: "{question}".""")
+        yield ("done", self._interact(question, deadline=deadline))
+
+    def _pump_stream(self, thread_id: str, cancel: threading.Event, results: "queue.Queue") -> None:
+        """Feeds ``stream_response`` into ``results`` as ("text", str) items,
+        then ("end", exception or None), so the reader can wait with a timeout."""
+        try:
+            for text in self.stream_response(thread_id, cancel):
+                results.put(("text", text))
+        except Exception as e:
+            results.put(("end", e))
+        else:
+            results.put(("end", None))
+
+    def _hedge(self, question: str, cancel: threading.Event) -> Optional[Dict[str, Any]]:
+        """A regular run alongside a slow stream; None unless valid."""
+        try:
+            output = self.attempt(question, cancel)
+        except Exception as e:
+            LOGGER.error(f"Error retrieving response: {e}")
+            return None
+        return output if output and is_valid_output(output) else None
+
+
+def answer_record(
+    assistant: AssistantInteraction, question: str, use_cache: bool = True
+) -> Optional[Dict[str, Any]]:
+    # No deadline fallback: a stale nearest-neighbour answer must not be
+    # recorded as this question's answer.
+    answer = assistant.interact(question, use_cache=use_cache, fallback=False)
+    if not answer or not is_valid_output(answer):
+        LOGGER.warning(f"Leaving question for the next batch run: {question}")
+        return None
+    return {"question": question, "answer": answer}
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Answer Ask AP questions.")
+    parser.add_argument("question", nargs="?", help="Answer a single question.")
+    parser.add_argument(
+        "--batch",
+        default="data/search_bar.txt",
+        help="Questions file (.txt, one per line, or .jsonl with a 'question' field).",
+    )
+    parser.add_argument(
+        "--out",
+        default="data/batch_answers.jsonl",
+        help="Crash-safe JSONL store; questions already in it are skipped.",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-ask instead of reading data/cached_answers.json, e.g. after a prompt or vector store "
+        "change. Fresh answers replace their cache entries; the rest of the cache is kept.",
+    )
+    args = parser.parse_args()
+
     assistant = AssistantInteraction(
         "asst_3Mp4nLnLS13ciCRWUjkFO6hz", "data/articles_relevant_keys.json"
     )
-    import sys
 
-    if len(sys.argv) > 1:
-        question = sys.argv[1]
+    if args.question:
         start = time.time()
-        assistant.interact(question)
+        assistant.interact(args.question)
         end = time.time()
         print(f"Time taken: {end - start:.2f}s")
     else:
-        questions = read("data/search_bar.txt")
-        answers = read("data/cached_answers.json")
-        for question in questions:
-            question = question.strip().lower()
-            if question not in answers:
-                answers[question] = assistant.interact(question)
-        with open("data/cached_answers.json", "w") as f:
-            json.dump(answers, f, indent=2, ensure_ascii=False)
-
+        questions = [q.lower() for q in read_items(args.batch, "question")]
+        stats = run_batch(
+            questions,
+            lambda question: answer_record(assistant, question, use_cache=not args.refresh),
+            JsonlStore(args.out),
+            workers=args.workers,
+            key_fn=normalize_question,
+        )
+        print(f"Batch finished: {stats}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+
+from logger import logger
+
+FIELDS = ("id", "title", "url", "youtubeURL")
+
+
+class ArticleStore(Mapping):
+    """Read-only article metadata keyed by filename, backed by SQLite.
+
+    Behaves like the ``articles_relevant_keys.json`` dict (``store[filename]``,
+    ``.get``) but nothing is parsed up front: lookups hit a memory-mapped
+    database file whose pages the OS shares between worker processes.
+    """
+
+    MMAP_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if (conn := getattr(self.local, "conn", None)) is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro&immutable=1", uri=True)
+            conn.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        return {field: value for field, value in zip(FIELDS, row) if value is not None}
+
+    def __getitem__(self, filename: str) -> Dict[str, Any]:
+        row = self.conn.execute(
+            "SELECT id, title, url, youtube_url FROM articles WHERE filename = ?", (filename,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(filename)
+        return self._row_to_dict(row)
+
+    def __iter__(self) -> Iterator[str]:
+        for (filename,) in self.conn.execute("SELECT filename FROM articles ORDER BY filename"):
+            yield filename
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def filename_for_url(self, url: str) -> Optional[str]:
+        row = self.conn.execute("SELECT filename FROM articles WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def build(json_path: str, db_path: str) -> None:
+        logger.info(f"Building article store {db_path} from {json_path}")
+        with open(json_path, "r", encoding="utf-8") as f:
+            articles = json.load(f)
+        tmp_path = f"{db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        conn.execute(
+            "CREATE TABLE articles (filename TEXT PRIMARY KEY, id TEXT, title TEXT, "
+            "url TEXT, youtube_url TEXT) WITHOUT ROWID"
+        )
+        conn.executemany(
+            "INSERT INTO articles VALUES (?, ?, ?, ?, ?)",
+            (
+                (filename, *(article.get(field) for field in FIELDS))
+                for filename, article in articles.items()
+            ),
+        )
+        conn.execute("CREATE INDEX articles_url ON articles (url)")
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        os.replace(tmp_path, db_path)
+        logger.info(f"Article store with {len(articles)} articles written to {db_path}")
+
+
+@lru_cache(maxsize=None)
+def load_articles(json_path: str = "data/articles_relevant_keys.json") -> ArticleStore:
+    """Returns the process-wide store for ``json_path``, (re)building its
+    ``.sqlite`` sibling if it is missing or older than the JSON."""
+    db_path = os.path.splitext(json_path)[0] + ".sqlite"
+    if os.path.exists(json_path) and (
+        not os.path.exists(db_path) or os.path.getmtime(db_path) < os.path.getmtime(json_path)
+    ):
+        ArticleStore.build(json_path, db_path)
+    return ArticleStore(db_path)
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "data/articles_relevant_keys.json"
+    ArticleStore.build(json_path, os.path.splitext(json_path)[0] + ".sqlite")
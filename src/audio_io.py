@@ -0,0 +1,95 @@
+import struct
+import wave
+from typing import Iterable, Iterator, NamedTuple
+
+import ffmpeg
+import numpy as np
+
+# Every intermediate of the dubbing pipeline is 16-bit PCM WAV in this format;
+# the only lossy encode is the final mux.
+SAMPLE_RATE = 44100
+CHANNELS = 1
+SAMPLE_WIDTH = 2
+
+
+def duration_ms(path: str) -> int:
+    """Length of an audio file from its header, without decoding it."""
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            return round(f.getnframes() * 1000 / f.getframerate())
+    return round(float(ffmpeg.probe(path)["format"]["duration"]) * 1000)
+
+
+def read_pcm(path: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS) -> np.ndarray:
+    """Samples of ``path`` as float32 of shape (n, channels) at ``sample_rate``.
+
+    WAV files already in the internal format are read directly; anything
+    else is decoded and resampled by ffmpeg.
+    """
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            if (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (sample_rate, channels, SAMPLE_WIDTH):
+                data = f.readframes(f.getnframes())
+                return np.frombuffer(data, dtype=np.int16).reshape(-1, channels).astype(np.float32)
+    data, _ = (
+        ffmpeg.input(path)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ar=sample_rate, ac=channels)
+        .global_args("-loglevel", "error")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(data, dtype=np.int16).reshape(-1, channels).astype(np.float32)
+
+
+def iter_pcm(path: str, frames: int) -> Iterator[bytes]:
+    """Raw sample data of a WAV file, ``frames`` at a time."""
+    with wave.open(path, "rb") as f:
+        while data := f.readframes(frames):
+            yield data
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+    """Writes float samples of shape (n,) or (n, channels) as 16-bit WAV."""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    write_pcm(path, [np.clip(samples, -32768, 32767).astype(np.int16).tobytes()], sample_rate, samples.shape[1])
+
+
+def write_pcm(
+    path: str, chunks: Iterable[bytes], sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS
+) -> None:
+    """Wraps raw little-endian 16-bit PCM chunks (e.g. a provider stream) in a WAV header."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(sample_rate)
+        for chunk in chunks:
+            f.writeframes(chunk)
+
+
+class WavInfo(NamedTuple):
+    sample_rate: int
+    channels: int
+    sample_width: int
+    frames: int
+    data_offset: int
+
+
+def wav_info(path: str) -> WavInfo:
+    """Format of a WAV file and where its sample data starts, so it can be
+    patched in place."""
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"Not a WAV file: {path}")
+        fmt = None
+        while len(header := f.read(8)) == 8:
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + size % 2, 1)
+            elif chunk_id == b"data" and fmt:
+                channels, sample_rate, sample_width = fmt[1], fmt[2], fmt[5] // 8
+                return WavInfo(sample_rate, channels, sample_width, size // (channels * sample_width), f.tell())
+            else:
+                f.seek(size + size % 2, 1)
+    raise ValueError(f"No audio data in {path}")
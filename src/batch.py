@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from logger import logger
+
+
+def read_items(path: str, field: str) -> List[str]:
+    """Reads batch inputs from a .txt (one per line), .jsonl or .csv file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".txt"):
+            items = f.read().splitlines()
+        elif path.endswith(".jsonl"):
+            items = [json.loads(line)[field] for line in f if line.strip()]
+        elif path.endswith(".csv"):
+            items = [row[field] for row in csv.DictReader(f)]
+        else:
+            logger.error(f"File type not supported: {path}")
+            raise ValueError(f"File type not supported: {path}")
+    return [item.strip() for item in items if item and item.strip()]
+
+
+class JsonlStore:
+    """Append-only JSONL result file that survives crashes.
+
+    Every record is flushed and fsynced as soon as it is written, so a killed
+    run loses at most the item in flight; a torn last line is skipped on reload.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def records(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt line {line_no} in {self.path}")
+        return records
+
+    def done(self) -> set:
+        return {record["key"] for record in self.records()}
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a+b") as f:
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Terminate a torn last line so the new record starts on its own.
+                        f.write(b"\n")
+                f.write(line.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def run_batch(
+    items: Iterable[str],
+    process: Callable[[str], Optional[Dict[str, Any]]],
+    store: JsonlStore,
+    workers: int = 4,
+    key_fn: Callable[[str], str] = lambda item: item,
+) -> Dict[str, int]:
+    """Runs ``process`` over items not yet in ``store`` with ``workers`` threads.
+
+    ``process`` returns the record to append, or None if the item should be
+    retried on the next run. Records get the item ``key`` and elapsed seconds added.
+    """
+    seen = store.done()
+    pending = []
+    stats = {"skipped": 0, "done": 0, "failed": 0}
+    for item in items:
+        if (key := key_fn(item)) in seen:
+            stats["skipped"] += 1
+        else:
+            seen.add(key)
+            pending.append(item)
+    logger.info(f"Batch: {len(pending)} pending, {stats['skipped']} already done")
+
+    def task(item: str) -> Optional[Dict[str, Any]]:
+        start = time.time()
+        record = process(item)
+        if record is not None:
+            record["key"] = key_fn(item)
+            record["seconds"] = round(time.time() - start, 3)
+            store.append(record)
+        return record
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(task, item): item for item in pending}
+        for i, future in enumerate(as_completed(futures), start=1):
+            item = futures[future]
+            try:
+                ok = future.result() is not None
+            except Exception as e:
+                logger.error(f"Batch item failed: {item}: {e}")
+                ok = False
+            stats["done" if ok else "failed"] += 1
+            logger.info(f"Batch progress {i}/{len(pending)} ({'ok' if ok else 'failed'}): {item}")
+    logger.info(f"Batch finished: {stats}")
+    return stats
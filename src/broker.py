@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.answer import AssistantInteraction
+from src.metrics import METRICS
+from src.process import answer_events
+from src.utils import normalize_question
+
+LOGGER = logging.getLogger("AskAPBroker")
+
+Event = Tuple[str, Any]
+
+
+class Flight:
+    """One in-flight question. The leader publishes answer events; any number of
+    waiting sessions replay them from the start, then follow new ones."""
+
+    def __init__(self, question: str, stream: bool):
+        self.question = question
+        self.stream = stream
+        self.events: List[Event] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.cond = threading.Condition()
+
+    def publish(self, event: Event) -> None:
+        with self.cond:
+            self.events.append(event)
+            self.cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self.cond:
+            self.error = error
+            self.finished = True
+            self.cond.notify_all()
+
+    def __iter__(self) -> Iterator[Event]:
+        i = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.events) > i or self.finished)
+                events = self.events[i:]
+                finished, error = self.finished, self.error
+            for event in events:
+                yield event
+            i += len(events)
+            if finished and i == len(self.events):
+                if error:
+                    raise error
+                return
+
+    def result(self) -> Dict[str, Any]:
+        for kind, payload in self:
+            if kind == "done":
+                return payload
+        raise RuntimeError(f"No answer produced for question: {self.question}")
+
+
+class RequestBroker:
+    """Single-flight front end for a shared ``AssistantInteraction``.
+
+    Questions are scheduled on a background asyncio loop. Concurrent requests
+    for the same normalized question join the run already in flight instead of
+    starting their own, and at most ``max_runs`` runs are outstanding at once;
+    cache hits skip that limit. The blocking assistant calls run on the loop's
+    thread pool.
+    """
+
+    MAX_RUNS = 8
+
+    def __init__(self, assistant: AssistantInteraction, max_runs: int = MAX_RUNS):
+        self.assistant = assistant
+        self.max_runs = max_runs
+        self.flights: Dict[str, Flight] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.loop = asyncio.new_event_loop()
+        # One thread per outstanding run, plus headroom for cache lookups.
+        self.loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=2 * max_runs, thread_name_prefix="ask-ap-broker")
+        )
+        self.runs = asyncio.Semaphore(max_runs)
+        self.running = 0
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        LOGGER.info(f"Request broker started with max_runs={max_runs}")
+
+    def ask(self, question: str) -> Dict[str, Any]:
+        """Blocking: returns the answer, sharing a run with identical questions."""
+        return self._join(question, stream=False).result()
+
+    def stream(self, question: str) -> Iterator[Event]:
+        """Same events as ``AssistantInteraction.stream_interact``. Joining a
+        non-streaming flight only yields its ``done`` event."""
+        return iter(self._join(question, stream=True))
+
+    def _join(self, question: str, stream: bool) -> Flight:
+        return asyncio.run_coroutine_threadsafe(self._flight(question, stream), self.loop).result()
+
+    async def _flight(self, question: str, stream: bool) -> Flight:
+        key = normalize_question(question)
+        if flight := self.flights.get(key):
+            METRICS.inc("ask_ap_coalesced")
+            LOGGER.info(f"Joining in-flight question: {question}")
+            return flight
+        flight = self.flights[key] = Flight(question, stream)
+        task = self.loop.create_task(self._fly(key, flight))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self._update_gauges()
+        return flight
+
+    async def _fly(self, key: str, flight: Flight) -> None:
+        try:
+            if cached := await asyncio.to_thread(self.assistant.cached, flight.question):
+                for event in answer_events(cached):
+                    flight.publish(event)
+            else:
+                with METRICS.span("ask_ap_broker_wait"):
+                    await self.runs.acquire()
+                self.running += 1
+                self._update_gauges()
+                try:
+                    await asyncio.to_thread(self._run, flight)
+                finally:
+                    self.running -= 1
+                    self.runs.release()
+            flight.finish()
+        except Exception as e:
+            LOGGER.error(f"Flight failed for question {flight.question}: {e}")
+            flight.finish(e)
+        finally:
+            del self.flights[key]
+            self._update_gauges()
+
+    def _run(self, flight: Flight) -> None:
+        if flight.stream:
+            for event in self.assistant.stream_interact(flight.question, use_cache=False):
+                flight.publish(event)
+        else:
+            flight.publish(("done", self.assistant.interact(flight.question, use_cache=False)))
+
+    def _update_gauges(self) -> None:
+        METRICS.set_gauge("ask_ap_broker_flights", len(self.flights))
+        METRICS.set_gauge("ask_ap_broker_runs", self.running)
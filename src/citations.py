@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+from openai import OpenAI
+
+from logger import logger
+from src.utils import read, write
+
+INDEX_PATH = "data/file_index.json"
+VECTOR_STORE_ID = "vs_p0N3kJVZjg9UKsNoAVMqQhhq"
+
+
+class CitationIndex:
+    """Persistent file_id -> filename map used to resolve file_search citations.
+
+    Filenames of uploaded files never change, so the map is built once in bulk
+    from the vector store (``build``), loaded at startup, and misses are filled
+    in with one concurrent lookup per answer and persisted.
+    """
+
+    LOOKUP_WORKERS = 8
+
+    def __init__(
+        self,
+        client: OpenAI,
+        path: Optional[str] = INDEX_PATH,
+        articles_md: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.client = client
+        self.path = path
+        self.articles_md = articles_md
+        self.lock = threading.Lock()
+        self.filenames: Dict[str, str] = read(path) if path and os.path.exists(path) else {}
+        logger.info(f"Citation index loaded with {len(self.filenames)} files")
+
+    def __len__(self) -> int:
+        return len(self.filenames)
+
+    def filename(self, file_id: str) -> str:
+        return self.resolve([file_id])[file_id]
+
+    def article(self, file_id: str) -> Optional[Dict[str, Any]]:
+        if self.articles_md is None:
+            return None
+        return self.articles_md.get(self.filename(file_id))
+
+    def resolve(self, file_ids: Iterable[str]) -> Dict[str, str]:
+        file_ids = list(dict.fromkeys(file_ids))
+        missing = [file_id for file_id in file_ids if file_id not in self.filenames]
+        if missing:
+            logger.info(f"Citation index miss for {len(missing)} files, looking them up")
+            with ThreadPoolExecutor(max_workers=min(self.LOOKUP_WORKERS, len(missing))) as executor:
+                found = dict(
+                    zip(
+                        missing,
+                        executor.map(
+                            lambda file_id: self.client.files.retrieve(file_id).filename,
+                            missing,
+                        ),
+                    )
+                )
+            self.update(found)
+        return {file_id: self.filenames[file_id] for file_id in file_ids}
+
+    def update(self, filenames: Dict[str, str]) -> None:
+        with self.lock:
+            self.filenames.update(filenames)
+            if self.path:
+                write(self.path, self.filenames, verbose=False)
+
+    def build(self, vector_store_id: str = VECTOR_STORE_ID) -> int:
+        """Indexes every file in the vector store with two paginated listings."""
+        file_ids = {
+            f.id
+            for f in self.client.beta.vector_stores.files.list(
+                vector_store_id=vector_store_id, limit=100
+            )
+        }
+        logger.info(f"Vector store {vector_store_id} has {len(file_ids)} files")
+        filenames = {
+            f.id: f.filename
+            for f in self.client.files.list(purpose="assistants")
+            if f.id in file_ids
+        }
+        if missing := file_ids - filenames.keys():
+            logger.warning(f"{len(missing)} vector store files not found in file listing")
+        self.update(filenames)
+        return len(filenames)
+
+
+def main():
+    vector_store_id = sys.argv[1] if len(sys.argv) > 1 else VECTOR_STORE_ID
+    index = CitationIndex(OpenAI())
+    print(f"Indexed {index.build(vector_store_id)} files into {index.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,11 +48,11 @@ def speed_up_video(input_path, output_path, speed):
         
 def extract_audio(video_path, output_path):
     logger.info(f"Extracting audio from video: {video_path}")
-    assert output_path.endswith(".mp3"), "Output path must end with .mp3"
+    assert output_path.endswith(".wav"), "Output path must end with .wav"
     try:
         stdout, stderr = (
             ffmpeg.input(video_path)
-            .output(output_path, vn=None, acodec="libmp3lame", ar=16000, ac=1)
+            .output(output_path, vn=None, acodec="pcm_s16le", ar=16000, ac=1)
             .overwrite_output()
             .run(capture_stdout=True, capture_stderr=True)
         )
@@ -66,43 +66,78 @@ def extract_audio(video_path, output_path):
         logger.error(f"Error extracting audio: {e.stderr.decode()}")
         return None
 
-def change_audio_speed(audio_file, output_file, factor):
-    logger.info(f"Speeding by {factor} for {audio_file=} ")
-    try:
-        stdout, stderr = (
-            ffmpeg.input(audio_file)
-            .filter("atempo", factor)
-            .output(output_file)
+class StreamingMux:
+    """ffmpeg muxing a video's picture with PCM audio fed through ``write``.
+
+    The output is fragmented MP4 with the moov atom up front, so players can
+    open ``partial_path`` while later fragments are still being written; it is
+    moved to ``output_file`` once ffmpeg finishes. ffmpeg starts on the first
+    ``write``.
+    """
+
+    FRAGMENT_FLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+    def __init__(self, video_file, output_file, sample_rate=44100, channels=1):
+        self.video_file = video_file
+        self.output_file = output_file
+        self.partial_path = output_file.replace(".mp4", ".partial.mp4")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.process = None
+        self.written = 0
+
+    @property
+    def started(self):
+        return self.process is not None
+
+    @property
+    def seconds(self):
+        return self.written / (2 * self.channels * self.sample_rate)
+
+    def start(self):
+        video = ffmpeg.input(self.video_file)
+        audio = ffmpeg.input("pipe:", format="s16le", ar=self.sample_rate, ac=self.channels)
+        logger.info(f"Muxing {self.video_file} with streamed audio into {self.partial_path}")
+        self.process = (
+            ffmpeg.output(
+                video.video,
+                audio.audio,
+                self.partial_path,
+                vcodec="copy",
+                acodec="aac",
+                movflags=self.FRAGMENT_FLAGS,
+                format="mp4",
+            )
             .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdin=True)
         )
-    except ffmpeg.Error as e:
-        logger.error(f"Error adjusting audio speed: {e.stderr.decode()}")
 
-def merge_audio_video(video_file, audio_file, output_file):
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i", video_file,
-        "-i", audio_file,
-        "-c:v", "copy",
-        "-c:a", "aac",
-        "-map", "0:v:0",
-        "-map", "1:a:0",
-        output_file,
-    ]
-    logger.info("Running command: " + " ".join(cmd))
+    def write(self, data):
+        if self.process is None:
+            self.start()
+        self.process.stdin.write(data)
+        self.written += len(data)
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        self.process.wait()
+        if self.process.returncode:
+            raise RuntimeError(f"ffmpeg failed to mux {self.output_file} (exit {self.process.returncode})")
+        os.replace(self.partial_path, self.output_file)
+        logger.info(f"Muxed {self.seconds:.1f}s of audio into {self.output_file}")
+
+    def abort(self):
+        """Stops ffmpeg and drops the partial output."""
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
 
-    try:
-        subprocess.run(cmd, check=True, capture_output=True)
-        if os.path.exists(output_file):
-            logger.info(f"Merged audio and video into {output_file}")
-        else:
-            logger.error("Error: Output file not created.")
-            return None
-    except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg error: {e.stderr.decode()}")
-        return None
 
 if __name__ == "__main__":
     video_path = "/Users/saurabhpurohit/Desktop/telugu/vid_fast.mp4"
@@ -3,6 +3,7 @@ import os
 from openai import OpenAI
 from tqdm import tqdm
 
+from src.citations import CitationIndex
 from src.process import parse_text, process_citations
 
 bcolors = {
@@ -98,7 +99,7 @@ def main():
     messages = client.beta.threads.messages.list(thread_id=thread_id)
 
     message_content = messages.data[0].content[0].text
-    process_citations(client, message_content)
+    process_citations(CitationIndex(client), message_content)
     print(f"{bcolors.OKBLUE}{message_content.value}{bcolors.ENDC}")
 
 
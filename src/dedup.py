@@ -0,0 +1,140 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from logger import logger
+from src.metrics import METRICS
+from src.utils import normalize_question, read, write
+
+PRIME = 4294967291  # largest prime below 2**32
+
+
+def shingles(text: str, size: int = 5) -> Set[str]:
+    text = normalize_question(text)
+    if len(text) <= size:
+        return {text}
+    return {text[i : i + size] for i in range(len(text) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index from past posts to the replies sent for them.
+
+    Posts are compared on character shingles of their normalized text, so
+    copy-pastes with small edits still match. Up to ``replies_per_post``
+    replies are kept per post and rotated through on later hits; until a
+    post has that many, ``get`` misses so a fresh reply gets generated.
+    The least recently used posts are evicted past ``max_size``, and the
+    index is persisted to ``path`` as post/replies pairs.
+    """
+
+    NUM_PERM = 128
+    BANDS = 32
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: float = 0.8,
+        max_size: int = 10000,
+        replies_per_post: int = 1,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_size = max_size
+        self.replies_per_post = replies_per_post
+        self.rows = self.NUM_PERM // self.BANDS
+        rng = np.random.RandomState(1)
+        self.a = rng.randint(1, PRIME, self.NUM_PERM, dtype=np.uint64)
+        self.b = rng.randint(0, PRIME, self.NUM_PERM, dtype=np.uint64)
+        self.lock = threading.Lock()
+        # post -> {"signature", "replies", "served"}
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.buckets: Dict[Tuple[int, bytes], Set[str]] = defaultdict(set)
+        if path and os.path.exists(path):
+            for item in read(path):
+                self._insert(item["post"], item["replies"])
+            logger.info(f"Loaded {len(self.entries)} past posts from {path}")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(
+            [zlib.crc32(s.encode("utf-8")) % PRIME for s in shingles(text)], dtype=np.uint64
+        )
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+    def _bands(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            for band in range(self.BANDS)
+        ]
+
+    def _insert(self, post: str, replies: List[str], signature: Optional[np.ndarray] = None) -> None:
+        signature = self.signature(post) if signature is None else signature
+        self.entries[post] = {"signature": signature, "replies": list(replies), "served": 0}
+        for band in self._bands(signature):
+            self.buckets[band].add(post)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, post: str) -> None:
+        entry = self.entries.pop(post)
+        for band in self._bands(entry["signature"]):
+            self.buckets[band].discard(post)
+            if not self.buckets[band]:
+                del self.buckets[band]
+
+    def _nearest(self, signature: np.ndarray) -> Tuple[Optional[str], float]:
+        candidates = set().union(*(self.buckets.get(band, ()) for band in self._bands(signature)))
+        best, best_score = None, 0.0
+        for post in candidates:
+            score = float(np.mean(self.entries[post]["signature"] == signature))
+            if score > best_score:
+                best, best_score = post, score
+        return best, best_score
+
+    def get(self, post: str) -> Optional[str]:
+        """A stored reply for a near-duplicate of ``post``, or None."""
+        signature = self.signature(post)
+        with self.lock:
+            match, score = self._nearest(signature)
+            if match is None or score < self.threshold:
+                METRICS.inc("replier_dedup_misses")
+                return None
+            entry = self.entries[match]
+            if len(entry["replies"]) < self.replies_per_post:
+                METRICS.inc("replier_dedup_misses")
+                return None
+            self.entries.move_to_end(match)
+            reply = entry["replies"][entry["served"] % len(entry["replies"])]
+            entry["served"] += 1
+        METRICS.inc("replier_dedup_hits")
+        logger.info(f"Near-duplicate post (similarity={score:.2f}), reusing reply for: {match[:80]}")
+        return reply
+
+    def add(self, post: str, reply: str) -> None:
+        """Stores ``reply``, under the near-duplicate it was generated for if any."""
+        signature = self.signature(post)
+        with self.lock:
+            match, score = self._nearest(signature)
+            if match is not None and score >= self.threshold:
+                entry = self.entries[match]
+                if len(entry["replies"]) < self.replies_per_post:
+                    entry["replies"].append(reply)
+                self.entries.move_to_end(match)
+            else:
+                self._insert(post, [reply], signature)
+            self._write_back()
+
+    def _write_back(self) -> None:
+        if not self.path:
+            return
+        write(
+            self.path,
+            [{"post": post, "replies": entry["replies"]} for post, entry in self.entries.items()],
+            verbose=False,
+        )
@@ -1,18 +1,23 @@
 import hashlib
 import os
 import re
-from math import sqrt
-from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
 import pysrt
-from pydub import AudioSegment
 
 import streamlit as st
 from logger import logger
-from src.cmd_utils import change_audio_speed, merge_audio_video
-from src.elevenlabs_api import sts
-from src.elevenlabs_api import tts as eleven_tts
-from src.gtts import tts as gtts
+from src.audio_io import CHANNELS, SAMPLE_RATE, duration_ms, iter_pcm, read_pcm, write_wav
+from src.cmd_utils import StreamingMux
+from src.duration_model import duration_model
+from src.elevenlabs_api import STS_MODEL, TTS_MODEL, sts_voice_id, tts_voice_id
+from src.metrics import METRICS
+from src.providers import provider
+from src.scheduler import BULK, INTERACTIVE, scheduler
+from src.segment_cache import SegmentCache, segment_cache
+from src.stretch import time_stretch
+from src.timeline import Timeline
 
 
 @st.cache_data
@@ -34,62 +39,412 @@ def get_lang_codes() -> Dict[str, str]:
 SPEAKERS = ["AP", "MALE", "FEMALE"]
 SPEED_MIN = 0.5
 SPEED_MAX = 5.0
+ELEVENLABS_LANGS = ["ta", "hi", "en"]
+STAGE_WORKERS = {"tts": 8, "sts": 4, "retime": 2}
+# Google TTS requests take up to 5000 bytes of SSML; leave room for the markup.
+BATCH_MAX_SEGMENTS = 10
+BATCH_MAX_BYTES = 3000
+
+
+
+def make_segment(
+    text,
+    lang_code,
+    folder,
+    speaker="AP",
+    gtts_creds=None,
+    start_time=None,
+    end_time=None,
+    index=0,
+    priority=BULK,
+) -> Dict[str, Any]:
+    flat_text = text.replace("\n", " ")
+    segment_hash = hashlib.sha256(
+        f"{lang_code}-{start_time}-{end_time}-{speaker}-{flat_text}".encode()
+    ).hexdigest()
+    segment_file = f"{folder}/{segment_hash}.wav"
+    return {
+        "index": index,
+        "text": text,
+        "lang_code": lang_code,
+        "speaker": speaker,
+        "speed": 1.0,
+        "gtts_creds": gtts_creds,
+        # Google voice, resolved before synthesis; batched cues use the SSML one.
+        "gtts_voice": None,
+        "ssml": False,
+        "start_time": start_time,
+        "end_time": end_time,
+        "tts_file": segment_file.replace(".wav", "_tts.wav"),
+        "segment_file": segment_file,
+        "output": f"{folder}/speed_{segment_hash}.wav",
+        "cache_key": None,
+        "cached": False,
+        "voiced": False,
+        "synthesized": False,
+        "warning": None,
+        "priority": priority,
+    }
+
+
+def voice_of(segment: Dict[str, Any]):
+    """(provider, voice, model) that will voice the segment."""
+    if segment["lang_code"] in ELEVENLABS_LANGS:
+        return "elevenlabs", tts_voice_id(segment["speaker"]), TTS_MODEL
+    # STS keeps the Google voice's timing, so both voices identify the output.
+    return "gtts+elevenlabs_sts", f"{segment['gtts_voice']}/{sts_voice_id(segment['speaker'])}", STS_MODEL
+
+
+def cache_key(segment: Dict[str, Any]) -> str:
+    """Key of the voiced (pre-retime) audio in the shared segment cache."""
+    provider, voice, model = voice_of(segment)
+    return SegmentCache.key(
+        segment["text"],
+        lang=segment["lang_code"],
+        provider=provider,
+        voice=voice,
+        model=model,
+        speed=segment["speed"],
+    )
+
+
+def target_speed(segment: Dict[str, Any]) -> float:
+    """Speaking rate expected to fit the subtitle slot, per the duration model.
+    Timing is set by the TTS provider (STS keeps it), so its rate range applies."""
+    if segment["start_time"] is None or segment["end_time"] is None:
+        return segment["speed"]
+    provider, voice, _ = voice_of(segment)
+    return duration_model().rate(
+        segment["lang_code"],
+        voice,
+        provider.split("+")[0],
+        segment["text"],
+        segment["end_time"] - segment["start_time"],
+    )
+
+
+def needs_synthesis(segment: Dict[str, Any]) -> bool:
+    """Sets the segment's speaking rate and cache key, and restores it from
+    earlier output or the segment cache. True if it still has to be voiced."""
+    if os.path.exists(segment["output"]):
+        segment["cached"] = True
+        return False
+    if segment["lang_code"] not in ELEVENLABS_LANGS:
+        segment["gtts_voice"] = provider("gtts_voice")(
+            segment["lang_code"], segment["speaker"], credentials=segment["gtts_creds"], ssml=segment["ssml"]
+        )
+    segment["speed"] = target_speed(segment)
+    segment["cache_key"] = cache_key(segment)
+    if segment_cache().get(segment["cache_key"], segment["segment_file"]):
+        segment["voiced"] = True
+        return False
+    segment["synthesized"] = True
+    return True
+
+
+def synthesize(segment: Dict[str, Any]) -> Dict[str, Any]:
+    """TTS stage. ElevenLabs languages are synthesized in the target voice
+    directly; the others go through Google TTS and then speech-to-speech.
+    The speaking rate comes from the duration model, so retime only corrects
+    the residual. Voiced audio is looked up in and added to the shared
+    segment cache."""
+    if needs_synthesis(segment):
+        request_tts(segment)
+    return segment
+
+
+def request_tts(segment: Dict[str, Any]) -> None:
+    with METRICS.span("dub_tts"):
+        if segment["lang_code"] in ELEVENLABS_LANGS:
+            scheduler().call(
+                "elevenlabs",
+                provider("elevenlabs_tts"),
+                segment["text"],
+                output_file=segment["segment_file"],
+                speaker=segment["speaker"],
+                speed=segment["speed"],
+                units=len(segment["text"]),
+                priority=segment["priority"],
+            )
+            segment_cache().put(segment["cache_key"], segment["segment_file"])
+            segment["voiced"] = True
+        else:
+            scheduler().call(
+                "gtts",
+                provider("gtts_tts"),
+                segment["text"],
+                segment["lang_code"],
+                output_file=segment["tts_file"],
+                voice_name=segment["gtts_voice"],
+                credentials=segment["gtts_creds"],
+                speaker=segment["speaker"],
+                speed=segment["speed"],
+                units=len(segment["text"]),
+                priority=segment["priority"],
+            )
+
+
+def synthesize_batch(segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """TTS stage for a group from ``batch_groups``: the segments that still
+    need voicing go to Google TTS as one SSML request, cut back into per-cue
+    clips at its mark timepoints. If the batch fails, each cue is requested
+    on its own."""
+    pending = [segment for segment in segments if needs_synthesis(segment)]
+    if len(pending) == 1:
+        request_tts(pending[0])
+        return segments
+    if not pending:
+        return segments
+    try:
+        with METRICS.span("dub_tts"):
+            scheduler().call(
+                "gtts",
+                provider("gtts_batch"),
+                [segment["text"] for segment in pending],
+                pending[0]["lang_code"],
+                [segment["tts_file"] for segment in pending],
+                credentials=pending[0]["gtts_creds"],
+                speaker=pending[0]["speaker"],
+                speeds=[segment["speed"] for segment in pending],
+                units=sum(len(segment["text"]) for segment in pending),
+                priority=min(segment["priority"] for segment in pending),
+            )
+        METRICS.inc("dub_tts_batched", len(pending))
+    except Exception as e:
+        logger.warning(f"Batched TTS of {len(pending)} cues failed, requesting them one by one: {e}")
+        METRICS.inc("dub_tts_batch_failed")
+        for segment in pending:
+            request_tts(segment)
+    return segments
+
+
+def batch_groups(segments: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Splits segments into runs of adjacent Google TTS cues with the same
+    speaker and language, for ``synthesize_batch``. Languages without an
+    SSML voice, and everything else, stay single."""
+    groups: List[List[Dict[str, Any]]] = []
+    supports_marks: Dict[tuple, bool] = {}
+    for segment in segments:
+        key = (segment["lang_code"], segment["speaker"])
+        if segment["lang_code"] not in ELEVENLABS_LANGS:
+            if key not in supports_marks:
+                supports_marks[key] = provider("gtts_supports_marks")(*key, credentials=segment["gtts_creds"])
+                if not supports_marks[key]:
+                    logger.info(f"No SSML voice for {key[0]}, not batching its cues")
+            if not supports_marks[key]:
+                METRICS.inc("dub_tts_batch_refused")
+        previous = groups[-1][-1] if groups else None
+        if (
+            supports_marks.get(key)
+            and previous
+            and (previous["lang_code"], previous["speaker"]) == key
+            and len(groups[-1]) < BATCH_MAX_SEGMENTS
+            and sum(len(s["text"].encode()) for s in groups[-1]) + len(segment["text"].encode()) <= BATCH_MAX_BYTES
+        ):
+            groups[-1].append(segment)
+        else:
+            groups.append([segment])
+    for group in groups:
+        if len(group) > 1:
+            # Every cue of a batch keeps the SSML voice, even when it ends up
+            # requested alone, so its cache key doesn't depend on its neighbours.
+            for segment in group:
+                segment["ssml"] = True
+    return groups
+
+
+def convert_voice(segment: Dict[str, Any]) -> Dict[str, Any]:
+    """STS stage, for segments synthesized with Google TTS."""
+    if segment["cached"] or segment["voiced"]:
+        return segment
+    with METRICS.span("dub_sts"):
+        scheduler().call(
+            "elevenlabs",
+            provider("elevenlabs_sts"),
+            segment["tts_file"],
+            segment["segment_file"],
+            speaker=segment["speaker"],
+            # ElevenLabs bills speech-to-speech by audio length; the text it
+            # was voiced from stands in for it, in the same units as TTS.
+            units=len(segment["text"]),
+            priority=segment["priority"],
+        )
+    segment_cache().put(segment["cache_key"], segment["segment_file"])
+    return segment
+
+
+def retime(segment: Dict[str, Any]) -> Dict[str, Any]:
+    """Stretches the segment in-process to fill its subtitle slot. Input and
+    output are PCM WAV, so nothing is decoded or re-encoded lossily."""
+    if segment["cached"]:
+        return segment
+    if segment["start_time"] is None or segment["end_time"] is None:
+        segment["output"] = segment["segment_file"]
+        return segment
+    with METRICS.span("dub_retime"):
+        samples = read_pcm(segment["segment_file"])
+        target_duration = segment["end_time"] - segment["start_time"]
+        natural_duration = round(len(samples) * 1000 / SAMPLE_RATE)
+        if segment["synthesized"]:
+            duration_model().observe(
+                segment["lang_code"], voice_of(segment)[1], segment["text"], segment["speed"], natural_duration
+            )
+        speed = natural_duration / target_duration
+        if speed > SPEED_MAX or speed < SPEED_MIN:
+            speed = max(SPEED_MIN, min(SPEED_MAX, speed))
+            segment["warning"] = (
+                f"Time for segment is too off. Natural time={natural_duration}, "
+                f"segment time={target_duration}"
+            )
+            logger.warning(segment["warning"])
+        logger.info(
+            f"Stretching segment {segment['index']} by {speed:.3f} after synthesis at rate {segment['speed']}"
+        )
+        METRICS.observe("dub_stretch_residual", abs(speed - 1.0))
+        write_wav(segment["output"], time_stretch(samples, speed, SAMPLE_RATE))
+    return segment
+
+
+STAGES = [("tts", synthesize), ("sts", convert_voice), ("retime", retime)]
+
+
+class SegmentPipeline:
+    """Runs segments through ``STAGES``, each stage on its own thread pool.
+
+    A segment moves to the next stage as soon as it leaves the previous one,
+    so segment i's STS overlaps segment i+1's TTS. Provider calls are further
+    rate limited by the process-wide ``scheduler``. Groups passed to ``run`` go through
+    ``batch_stage`` together in place of the first stage, then move on one by
+    one. Stage functions must not call Streamlit, since they run outside the
+    script thread.
+    """
+
+    def __init__(self, stages=STAGES, workers: Optional[Dict[str, int]] = None, batch_stage=synthesize_batch):
+        self.stages = stages
+        self.batch_stage = batch_stage
+        workers = {**STAGE_WORKERS, **(workers or {})}
+        self.pools = {
+            name: ThreadPoolExecutor(max_workers=workers[name], thread_name_prefix=f"dub-{name}")
+            for name, _ in stages
+        }
+
+    def advance(self, stage: int, segment: Dict[str, Any], result: Future) -> None:
+        if stage == len(self.stages):
+            result.set_result(segment)
+            return
+        name, fn = self.stages[stage]
+        future = self.pools[name].submit(fn, segment)
+        future.add_done_callback(
+            lambda f: result.set_exception(f.exception())
+            if f.exception()
+            else self.advance(stage + 1, f.result(), result)
+        )
+
+    def submit(self, segment: Dict[str, Any]) -> Future:
+        result = Future()
+        self.advance(0, segment, result)
+        return result
+
+    def submit_group(self, segments: List[Dict[str, Any]]) -> List[Future]:
+        results = [Future() for _ in segments]
+
+        def done(f: Future) -> None:
+            for segment, result in zip(segments, results):
+                if f.exception():
+                    result.set_exception(f.exception())
+                else:
+                    self.advance(1, segment, result)
+
+        self.pools[self.stages[0][0]].submit(self.batch_stage, segments).add_done_callback(done)
+        return results
+
+    def submit_all(
+        self, segments: List[Dict[str, Any]], groups: Optional[List[List[Dict[str, Any]]]] = None
+    ) -> List[Future]:
+        """Submits all segments, in order, and returns their futures in input order."""
+        futures = []
+        for group in groups or [[segment] for segment in segments]:
+            futures += self.submit_group(group) if len(group) > 1 else [self.submit(group[0])]
+        return futures
+
+    def run(
+        self, segments: List[Dict[str, Any]], groups: Optional[List[List[Dict[str, Any]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Processes all segments and returns them in input order."""
+        return [future.result() for future in self.submit_all(segments, groups)]
+
+    def close(self) -> None:
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+
+    def __enter__(self) -> "SegmentPipeline":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def output_of(future: Future) -> Future:
+    """Future of a pipeline segment's output file."""
+    output = Future()
+    future.add_done_callback(
+        lambda f: output.set_exception(f.exception()) if f.exception() else output.set_result(f.result()["output"])
+    )
+    return output
+
+
+def parse_speaker(text: str):
+    speaker = "AP"
+    if speaker_match := re.search(r"\[(.*?)\]", text):
+        if (s := speaker_match.group(1)) in SPEAKERS:
+            speaker = s
+        else:
+            logger.warning(f"Invalid speaker: {s}")
+    return re.sub(r"\[(.*)\]", "", text).strip(), speaker
+
 
 def process_srt_and_join(
-    srt_content, language_code, final_output, credentials=None
+    srt_content, language_code, final_output, credentials=None, folder=None, track_ms=None, sink=None
 ):
     subtitles = pysrt.from_string(srt_content)
     logger.info(f"Dubbing subtitles:\n```{subtitles}```")
-    audio = AudioSegment.empty()
-
-    gen_len = 0
-    first_start = subtitles[0].start.ordinal
-    if first_start > 0:
-        audio += AudioSegment.silent(duration=int(first_start))
-        gen_len += first_start
+    folder = folder or st.session_state.folder_name
+    os.makedirs(folder, exist_ok=True)
+    segments = []
     for i, sub in enumerate(subtitles):
-        text = sub.text.strip()
-        speaker = "AP"
-        if speaker_match := re.search(r"\[(.*?)\]", text):
-            if (s := speaker_match.group(1)) in SPEAKERS:
-                speaker = s
-            else:
-                logger.warning(f"Invalid speaker: {s}")
-        text = re.sub(r"\[(.*)\]", "", text).strip()        
-        logger.info(f"Dubbing segment {i}")
-        seg_audio = AudioSegment.from_mp3(dub_single_segment(
-            text, 
-            language_code, 
-            speaker=speaker,
-            gtts_creds=credentials,
-            start_time=sub.start.ordinal,
-            end_time=sub.end.ordinal
-        ))
-        
-        gen_len += len(seg_audio)
-        audio += seg_audio
-        
-        if i < len(subtitles) - 1:
-            gap = subtitles[i + 1].start.ordinal - (sub.start.ordinal + len(seg_audio))
-            if gap > 0:
-                audio += AudioSegment.silent(duration=gap)
-            elif gap < 0:
-                logger.warning(f"Negative gap ({gap}ms) detected between subtitles {i+1} and {i+2}. Audio segments may overlap due to subtitle timing overlap or generated audio being too long.")
-    audio.export(final_output, format="mp3")
-    print(f'Final audio written to "{final_output}"')
-    return gen_len
-
-def tts_sts(text, lang_code, final_output, tts_output=None, gtts_creds=None, **kwargs) -> AudioSegment:
-    if lang_code in ["ta", "hi", "en"]:
-        eleven_tts(text, output_file=final_output, **kwargs)
-    else:
-        if not tts_output:
-            tts_output = final_output.replace(".mp3", "_tts.mp3")
-        gtts(
-            text, lang_code, output_file=tts_output, credentials=gtts_creds, **kwargs
+        text, speaker = parse_speaker(sub.text.strip())
+        segments.append(
+            make_segment(
+                text,
+                language_code,
+                folder,
+                speaker=speaker,
+                gtts_creds=credentials,
+                start_time=sub.start.ordinal,
+                end_time=sub.end.ordinal,
+                index=i,
+            )
         )
-        sts(tts_output, final_output, speaker = kwargs.get("speaker", "AP"))
-    return AudioSegment.from_mp3(final_output)
+    logger.info(f"Dubbing {len(segments)} segments")
+    # The timeline mixes (and streams to ``sink``) each chunk as soon as the
+    # segments starting before its end are done, while later ones are voiced.
+    timeline = Timeline()
+    with METRICS.span("dub_segments"), SegmentPipeline() as pipeline:
+        futures = pipeline.submit_all(segments, batch_groups(segments))
+        for segment, future in zip(segments, futures):
+            timeline.add(segment["start_time"], output_of(future))
+        with METRICS.span("dub_render"):
+            lengths = timeline.render(final_output, duration_ms=track_ms, sink=sink)
+        segments = [future.result() for future in futures]
+    for segment in segments:
+        if segment["warning"]:
+            st.warning(segment["warning"])
+    for i in range(len(segments) - 1):
+        overlap = segments[i]["start_time"] + lengths[i] - segments[i + 1]["start_time"]
+        if overlap > 0:
+            logger.warning(f"Segments {i+1} and {i+2} overlap by {overlap}ms and are mixed. Subtitle timings overlap or generated audio is too long.")
+    print(f'Final audio written to "{final_output}"')
+    return subtitles[0].start.ordinal + sum(lengths)
 
 def create_dubbed_video(
     input_video_path: str,
@@ -99,48 +454,72 @@ def create_dubbed_video(
     text=None,
     srt_content=None,
     gtts_creds=None,
+    on_progress=None,
 ):
+    """Dubs the video. The mixed track is streamed into the muxer as it is
+    rendered; ``on_progress(mux)`` is called after each chunk, so callers can
+    preview ``mux.partial_path`` before the whole video is written."""
     if not text and not srt_content:
         st.error("Please upload a valid SRT or translated text.")
         return
     logger.info(f"Creating dubbed video for: {input_video_path}")
-    final_audio_path = os.path.dirname(output_video_path) + "/final_audio.mp3"
+    # Kept as WAV; the mux does the only lossy encode.
+    final_audio_path = os.path.dirname(output_video_path) + "/final_audio.wav"
+    input_len = duration_ms(input_audio_path)
     if not srt_content:
-        audio_duration = len(AudioSegment.from_file(input_audio_path)) / 1000
+        audio_duration = input_len / 1000
         audio_duration = f"{int(audio_duration/3600):02}:{int((audio_duration%3600)/60):02}:{int(audio_duration%60):02},000"
         srt_content = f"1\n00:00:00,000 --> {audio_duration}\n{text}"
-    gen_len = process_srt_and_join(srt_content, lang_code, final_audio_path, credentials=gtts_creds)
-    input_len = len(AudioSegment.from_file(input_audio_path))
-    final_len = len(AudioSegment.from_file(final_audio_path))
-    if abs(input_len - final_len) > 1000:
-        logger.warning(f"Audio length mismatch: {input_len} != {final_len}")
-    merge_audio_video(input_video_path, final_audio_path, output_video_path)
+    mux = StreamingMux(input_video_path, output_video_path, SAMPLE_RATE, CHANNELS)
+
+    def sink(data):
+        mux.write(data)
+        if on_progress:
+            on_progress(mux)
+
+    try:
+        gen_len = process_srt_and_join(
+            srt_content, lang_code, final_audio_path, credentials=gtts_creds, track_ms=input_len, sink=sink
+        )
+        final_len = duration_ms(final_audio_path)
+        if abs(input_len - final_len) > 1000:
+            logger.warning(f"Audio length mismatch: {input_len} != {final_len}")
+        if not mux.started:
+            # The track is unchanged; remux only if the video is missing or stale.
+            if os.path.exists(output_video_path) and os.path.getmtime(output_video_path) >= max(
+                os.path.getmtime(final_audio_path), os.path.getmtime(input_video_path)
+            ):
+                logger.info(f"Dubbed audio unchanged, keeping {output_video_path}")
+            else:
+                for data in iter_pcm(final_audio_path, SAMPLE_RATE):
+                    sink(data)
+    except BaseException:
+        mux.abort()
+        raise
+    mux.close()
     st.success("Dubbed video created!")
     logger.info("!Dubbed video created successfully!")  
 
 def dub_single_segment(text, lang_code, speaker="AP", gtts_creds=None, start_time=None, end_time=None) -> str:
     os.makedirs(st.session_state.folder_name, exist_ok=True)
-    segment_hash = hashlib.sha256(f"{start_time}-{end_time}-{speaker}-{text.replace('\n', ' ')}".encode()).hexdigest()
-    segment_file = f"{st.session_state.folder_name}/{segment_hash}.mp3"
-    speed_segment_file = f"{st.session_state.folder_name}/speed_{segment_hash}.mp3"
-    if os.path.exists(speed_segment_file):
-        return speed_segment_file
-    audio = tts_sts(text, lang_code, segment_file, gtts_creds=gtts_creds, speaker=speaker)
-    if start_time is not None and end_time is not None:
-        target_duration = end_time - start_time
-        natural_duration = len(audio)
-        speed = natural_duration / target_duration
-        
-        if speed > SPEED_MAX or speed < SPEED_MIN:
-            speed = max(SPEED_MIN, min(SPEED_MAX, speed))
-            warn = f"Time for segment is too off. Natural time={natural_duration}, segment time={target_duration}"
-            logger.warning(warn)
-            st.warning(warn)
-        change_audio_speed(segment_file, speed_segment_file, speed)
-    return speed_segment_file
+    segment = make_segment(
+        text,
+        lang_code,
+        st.session_state.folder_name,
+        speaker=speaker,
+        gtts_creds=gtts_creds,
+        start_time=start_time,
+        end_time=end_time,
+        priority=INTERACTIVE,
+    )
+    for _, stage in STAGES:
+        segment = stage(segment)
+    if segment["warning"]:
+        st.warning(segment["warning"])
+    return segment["output"]
 
 if __name__ == "__main__":
     data = "/tmp/session_1/"
-    input_audio = f"{data}input_audio.mp3"
-    output_audio = f"{data}tts_output.mp3"
-    final_output_path = f"{data}final_audio.mp3"
\ No newline at end of file
+    input_audio = f"{data}input_audio.wav"
+    output_audio = f"{data}tts_output.wav"
+    final_output_path = f"{data}final_audio.wav"
\ No newline at end of file
@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from logger import logger
+from src.utils import read, write
+
+MODEL_PATH = os.environ.get("DURATION_MODEL_PATH", "data/duration_model.json")
+# Rates each provider accepts: Google speaking_rate and ElevenLabs voice speed.
+RATE_RANGES = {"gtts": (0.25, 4.0), "elevenlabs": (0.7, 1.2)}
+RATE_STEP = 0.05
+VIRAMAS = set("्্੍્୍்్್്")
+LATIN_VOWELS = re.compile(r"[aeiouy]+")
+
+
+def syllables(text: str) -> int:
+    """Rough syllable count: aksharas for Indic scripts (consonants and
+    independent vowels not followed by a virama), vowel groups for Latin."""
+    text = unicodedata.normalize("NFC", text)
+    count = 0
+    for i, ch in enumerate(text):
+        if "ऀ" <= ch <= "෿" and unicodedata.category(ch) == "Lo":
+            if i + 1 == len(text) or text[i + 1] not in VIRAMAS:
+                count += 1
+    latin = "".join(ch for ch in text.lower() if ch.isascii())
+    return count + len(LATIN_VOWELS.findall(latin))
+
+
+def units(text: str) -> int:
+    """Syllables where the script allows counting them, else letters."""
+    return syllables(text) or sum(ch.isalnum() for ch in text)
+
+
+class DurationModel:
+    """Predicts how long a voice takes to speak a text, to pick a speaking rate.
+
+    Per (language, voice) it fits ``ms = a * units + b`` at rate 1.0 by least
+    squares over past segments (durations at other rates are scaled back by
+    the rate). Until ``MIN_SAMPLES`` segments are seen, no rate is predicted.
+    """
+
+    MIN_SAMPLES = 5
+
+    def __init__(self, path: Optional[str] = MODEL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        # "lang|voice" -> {"n", "sx", "sy", "sxx", "sxy"}
+        self.stats: Dict[str, Dict[str, float]] = read(path) if path and os.path.exists(path) else {}
+
+    @staticmethod
+    def _key(lang: str, voice: str) -> str:
+        return f"{lang}|{voice}"
+
+    def observe(self, lang: str, voice: str, text: str, rate: float, duration_ms: float) -> None:
+        x, y = units(text), duration_ms * rate
+        if not x:
+            return
+        with self.lock:
+            s = self.stats.setdefault(self._key(lang, voice), {"n": 0, "sx": 0, "sy": 0, "sxx": 0, "sxy": 0})
+            s["n"] += 1
+            s["sx"] += x
+            s["sy"] += y
+            s["sxx"] += x * x
+            s["sxy"] += x * y
+            if self.path:
+                write(self.path, self.stats, verbose=False)
+
+    def coefficients(self, lang: str, voice: str) -> Optional[Tuple[float, float]]:
+        with self.lock:
+            s = self.stats.get(self._key(lang, voice))
+            if not s or s["n"] < self.MIN_SAMPLES:
+                return None
+            n, sx, sy, sxx, sxy = s["n"], s["sx"], s["sy"], s["sxx"], s["sxy"]
+        denominator = n * sxx - sx * sx
+        if denominator <= 0:
+            return sy / sx, 0.0
+        a = (n * sxy - sx * sy) / denominator
+        b = (sy - a * sx) / n
+        if a <= 0:
+            return sy / sx, 0.0
+        return a, b
+
+    def predict_ms(self, lang: str, voice: str, text: str) -> Optional[float]:
+        """Expected duration at rate 1.0, or None while uncalibrated."""
+        if (coefficients := self.coefficients(lang, voice)) is None:
+            return None
+        a, b = coefficients
+        return max(a * units(text) + b, 1.0)
+
+    def rate(self, lang: str, voice: str, provider: str, text: str, target_ms: float) -> float:
+        """Speaking rate that should land on ``target_ms``, clamped to what the
+        provider accepts and rounded to ``RATE_STEP`` so cached segments are reused."""
+        predicted = self.predict_ms(lang, voice, text)
+        if predicted is None or target_ms <= 0:
+            return 1.0
+        low, high = RATE_RANGES[provider]
+        rate = min(max(predicted / target_ms, low), high)
+        return round(round(rate / RATE_STEP) * RATE_STEP, 2)
+
+
+@lru_cache(maxsize=None)
+def duration_model() -> DurationModel:
+    return DurationModel()
+
+
+if __name__ == "__main__":
+    model = DurationModel(sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH)
+    for key, s in sorted(model.stats.items()):
+        lang, voice = key.split("|", 1)
+        coefficients = model.coefficients(lang, voice)
+        fit = f"{coefficients[0]:.1f} ms/unit + {coefficients[1]:.0f} ms" if coefficients else "uncalibrated"
+        logger.info(f"{lang} {voice}: {int(s['n'])} segments, {fit}")
+        print(f"{lang:>6} {voice}: {int(s['n'])} segments, {fit}")
@@ -1,12 +1,34 @@
 import json
 import os
+from functools import lru_cache
 
 import dotenv
-from elevenlabs import ElevenLabs
+
+from src.audio_io import SAMPLE_RATE, write_pcm
 
 dotenv.load_dotenv()
 
-CLIENT = ElevenLabs(api_key=os.environ["ELEVENLABS_API_KEY"])
+
+@lru_cache(maxsize=None)
+def client():
+    """The ElevenLabs client, created (and the SDK imported) on first use."""
+    from elevenlabs import ElevenLabs
+
+    return ElevenLabs(api_key=os.environ["ELEVENLABS_API_KEY"])
+
+
+TTS_MODEL = "eleven_multilingual_v2"
+STS_MODEL = "eleven_multilingual_sts_v2"
+# Raw 16-bit mono PCM, saved as WAV; the pipeline never re-encodes it.
+OUTPUT_FORMAT = f"pcm_{SAMPLE_RATE}"
+
+
+def tts_voice_id(speaker):
+    return os.environ["PVC_ID"] if speaker == "AP" else get_voice_id(speaker)
+
+
+def sts_voice_id(speaker):
+    return os.environ["IVC_ID"] if speaker == "AP" else get_voice_id(speaker)
 
 
 def get_voice_id(speaker):
@@ -19,14 +41,14 @@ def get_voice_id(speaker):
     
 def sts(input_file: str, output_file: str, **kwargs):
     speaker = kwargs.get("speaker", "AP")
-    voice_id = os.environ["IVC_ID"] if speaker == "AP" else get_voice_id(speaker)
+    voice_id = sts_voice_id(speaker)
     with open(input_file, "rb") as f:
         audio = f.read()
-    audio = CLIENT.speech_to_speech.convert(
+    audio = client().speech_to_speech.convert(
         audio=audio,
         voice_id=voice_id,
-        output_format="mp3_44100_128",
-        model_id="eleven_multilingual_sts_v2",
+        output_format=OUTPUT_FORMAT,
+        model_id=STS_MODEL,
         enable_logging=True,
         voice_settings=json.dumps(
             {
@@ -37,22 +59,20 @@ def sts(input_file: str, output_file: str, **kwargs):
             }
         ),
     )
-    with open(output_file, "wb") as f:
-        for chunk in audio:
-            f.write(chunk)
+    write_pcm(output_file, audio)
     print(f"✅ Audio saved successfully as '{output_file}'")
 
 
-def tts(text, output_file="output.mp3", **kwargs):
+def tts(text, output_file="output.wav", **kwargs):
     speed = kwargs.get("speed", 1.0)
     speaker = kwargs.get("speaker", "AP")
-    voice_id = os.environ["PVC_ID"] if speaker == "AP" else get_voice_id(speaker)
+    voice_id = tts_voice_id(speaker)
     print(f"Using ElevenLabs API for text-to-speech conversion")
-    audio = CLIENT.text_to_speech.convert(
+    audio = client().text_to_speech.convert(
         text=text,
         voice_id=voice_id,
-        output_format="mp3_44100_128",
-        model_id="eleven_multilingual_v2",
+        output_format=OUTPUT_FORMAT,
+        model_id=TTS_MODEL,
         enable_logging=True,
         voice_settings={
             "stability": 0.5,
@@ -62,10 +82,8 @@ def tts(text, output_file="output.mp3", **kwargs):
             "use_speaker_boost": True,
         },
     )
-    with open(output_file, "wb") as f:
-        for chunk in audio:
-            f.write(chunk)
+    write_pcm(output_file, audio)
     print(f"✅ Audio saved successfully as '{output_file}'")
 
 if __name__ == "__main__":
-    tts("HOW ARE YOU DOING", output_file="output.mp3")
\ No newline at end of file
+    tts("HOW ARE YOU DOING", output_file="output.wav")
\ No newline at end of file
@@ -0,0 +1,299 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from logger import logger
+from src.articles import load_articles
+from src.utils import read
+
+
+def recorded_responses(answers_path: str = "data/cached_answers.json") -> List[Dict[str, Any]]:
+    """Rebuilds raw assistant texts (with file_search style citation markers)
+    from the parsed answers in ``cached_answers.json``."""
+    articles = load_articles()
+    responses = []
+    for answer in read(answers_path).values():
+        parts, annotations = [answer["header"]], []
+        for i, insight in enumerate(answer.get("insights", []), start=1):
+            line = f"{i}. {insight['quote']}"
+            filename = articles.filename_for_url(insight.get("article_url", ""))
+            if filename:
+                marker = f"【{i}:0†source】"
+                start = len("\n\n".join(parts)) + 2 + len(line)
+                annotations.append(
+                    {
+                        "type": "file_citation",
+                        "text": marker,
+                        "start_index": start,
+                        "end_index": start + len(marker),
+                        "file_citation": {"file_id": f"file-{filename}"},
+                    }
+                )
+                line += marker
+            parts.append(line)
+        responses.append({"value": "\n\n".join(parts), "annotations": annotations})
+    return responses
+
+
+class FakeOpenAIServer:
+    """Local stand-in for the parts of the OpenAI API the app uses.
+
+    Serves threads, messages, polled runs, file lookups, embeddings and chat
+    completions, replaying recorded answers. Run and completion latencies are drawn from a
+    lognormal distribution with the given median (seconds) and sigma; streamed
+    chat completions then emit a chunk every ``token_interval`` seconds.
+    Point clients at it with ``OPENAI_BASE_URL``; Assistants runs cannot be
+    streamed.
+    """
+
+    def __init__(
+        self,
+        latency_median: float = 2.0,
+        latency_sigma: float = 0.5,
+        token_interval: float = 0.02,
+        answers_path: str = "data/cached_answers.json",
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.token_interval = token_interval
+        self.responses = recorded_responses(answers_path)
+        self.lock = threading.Lock()
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.prefixes: Set[str] = set()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def latency(self) -> float:
+        return random.lognormvariate(0, self.latency_sigma) * self.latency_median
+
+    def start(self) -> "FakeOpenAIServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Fake OpenAI server listening on {self.base_url}")
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _run_status(self, run: Dict[str, Any]) -> str:
+        if run["status"] == "in_progress" and time.time() >= run["due"]:
+            run["status"] = "completed"
+            self.threads[run["thread_id"]].append(
+                _message(run["thread_id"], "assistant", run["response"]["value"], run["response"]["annotations"])
+            )
+        return run["status"]
+
+    def _prompt_usage(self, messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Approximate token counts; like the real prompt cache, a prefix seen
+        before (all but the last message, byte for byte) counts as cached in
+        128-token steps once it reaches 1024 tokens."""
+        prefix = json.dumps(messages[:-1], ensure_ascii=False)
+        prefix_tokens = len(prefix) // 4
+        prompt_tokens = prefix_tokens + len(json.dumps(messages[-1:], ensure_ascii=False)) // 4
+        with self.lock:
+            seen = prefix in self.prefixes
+            self.prefixes.add(prefix)
+        cached = prefix_tokens // 128 * 128 if seen and prefix_tokens >= 1024 else 0
+        return prompt_tokens, cached
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Any:
+        with self.lock:
+            if method == "POST" and path == "/threads":
+                thread_id = _id("thread")
+                self.threads[thread_id] = []
+                return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+            if m := re.fullmatch(r"/threads/([^/]+)/messages", path):
+                thread_id = m.group(1)
+                if method == "POST":
+                    message = _message(thread_id, body.get("role", "user"), body.get("content", ""), [])
+                    self.threads[thread_id].append(message)
+                    return message
+                data = list(reversed(self.threads[thread_id]))
+                return {"object": "list", "data": data, "has_more": False}
+            if method == "POST" and (m := re.fullmatch(r"/threads/([^/]+)/runs", path)):
+                run = {
+                    "id": _id("run"),
+                    "object": "thread.run",
+                    "thread_id": m.group(1),
+                    "assistant_id": body.get("assistant_id"),
+                    "status": "in_progress",
+                    "created_at": int(time.time()),
+                    "due": time.time() + self.latency(),
+                    "response": random.choice(self.responses),
+                }
+                self.runs[run["id"]] = run
+                return _public(run)
+            if m := re.fullmatch(r"/threads/([^/]+)/runs/([^/]+)(/cancel)?", path):
+                run = self.runs[m.group(2)]
+                if m.group(3):
+                    run["status"] = "cancelled"
+                self._run_status(run)
+                return _public(run)
+            if method == "GET" and (m := re.fullmatch(r"/files/file-(.+)", path)):
+                file_id = f"file-{m.group(1)}"
+                return {
+                    "id": file_id,
+                    "object": "file",
+                    "filename": m.group(1),
+                    "bytes": 0,
+                    "created_at": 0,
+                    "purpose": "assistants",
+                    "status": "processed",
+                }
+        if method == "POST" and path == "/embeddings":
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            return {
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": _embedding(text)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        if method == "POST" and path == "/chat/completions":
+            time.sleep(self.latency())
+            content = random.choice(self.responses)["value"].split("\n\n")[-1]
+            prompt_tokens, cached_tokens = self._prompt_usage(body.get("messages", []))
+            completion_tokens = len(content) // 4
+            if body.get("stream"):
+                return self._chunks(content, body.get("model", "fake"))
+            return {
+                "id": _id("chatcmpl"),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            }
+        return None
+
+    def _chunks(self, content: str, model: str) -> Iterator[Dict[str, Any]]:
+        """Chat completion chunks, a few characters apart like streamed tokens."""
+        completion_id, created = _id("chatcmpl"), int(time.time())
+        pieces = [content[i : i + 4] for i in range(0, len(content), 4)] + [None]
+        for piece in pieces:
+            time.sleep(self.token_interval)
+            yield {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": piece} if piece else {},
+                        "finish_reason": None if piece else "stop",
+                    }
+                ],
+            }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                path = self.path.split("?")[0].removeprefix("/v1")
+                try:
+                    payload = server.handle(method, path, body)
+                    status = 200 if payload is not None else 404
+                except KeyError:
+                    payload, status = None, 404
+                if isinstance(payload, Iterator):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for chunk in payload:
+                        self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+                payload = payload or {"error": {"message": f"Unknown path: {method} {path}"}}
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _message(thread_id: str, role: str, value: str, annotations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": _id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "status": "completed",
+        "content": [{"type": "text", "text": {"value": value, "annotations": annotations}}],
+    }
+
+
+def _embedding(text: str, dimensions: int = 256) -> List[float]:
+    """Deterministic pseudo-embedding: equal texts get equal vectors."""
+    rng = random.Random(text)
+    return [rng.gauss(0, 1) for _ in range(dimensions)]
+
+
+def _public(run: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in run.items() if k not in ("due", "response")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI API for load tests.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-median", type=float, default=2.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.latency_median, args.latency_sigma, port=args.port).start()
+    print(f"export OPENAI_BASE_URL={server.base_url}")
+    server.thread.join()
+
+
+if __name__ == "__main__":
+    main()
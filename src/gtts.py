@@ -1,60 +1,191 @@
 import os
-from typing import Dict, Optional
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
 
+from xml.sax.saxutils import escape
+
+from google.cloud import texttospeech_v1beta1
 from google.cloud.texttospeech import (AudioConfig, AudioEncoding,
                                        SynthesisInput, TextToSpeechClient,
                                        VoiceSelectionParams)
 from google.oauth2 import service_account
 
 from logger import logger
+from src.audio_io import SAMPLE_RATE, read_pcm, write_wav
+from src.utils import read, write
+
+
+VOICE_CATALOG_PATH = os.environ.get("GTTS_VOICE_CATALOG_PATH", "data/gtts_voices.json")
+VOICE_CATALOG_TTL = 24 * 3600
+POOL_SIZE = 4
+# Pause between texts of a batched request, so each is spoken as its own phrase.
+BATCH_BREAK_MS = 300
+# Voice types that accept SSML marks, best first.
+SSML_VOICE_TYPES = ("Neural2", "Wavenet", "Standard")
+
+
+class ClientPool:
+    """Up to ``size`` ``TextToSpeechClient``s per service account, handed out
+    round robin. Clients are thread-safe, so they are shared by every thread
+    and session instead of opening a channel per request."""
+
+    def __init__(self, size: int = POOL_SIZE, client_class=TextToSpeechClient):
+        self.size = size
+        self.client_class = client_class
+        self.lock = threading.Lock()
+        self.clients: Dict[str, List[TextToSpeechClient]] = {}
+        self.turns: Dict[str, int] = {}
+
+    @staticmethod
+    def _key(credentials: Optional[Dict]) -> str:
+        if not credentials:
+            return "default"
+        return f"{credentials.get('client_email')}/{credentials.get('private_key_id')}"
+
+    def get(self, credentials: Optional[Dict] = None) -> TextToSpeechClient:
+        key = self._key(credentials)
+        with self.lock:
+            clients = self.clients.setdefault(key, [])
+            turn = self.turns.get(key, 0)
+            self.turns[key] = turn + 1
+            if len(clients) < self.size:
+                info = service_account.Credentials.from_service_account_info(credentials) if credentials else None
+                clients.append(self.client_class(credentials=info))
+                logger.info(f"Created TTS client {len(clients)}/{self.size} for {key}")
+            return clients[turn % len(clients)]
+
+
+class VoiceCatalog:
+    """Voices per (service account, language) and the voice chosen per
+    speaker, kept for ``ttl`` seconds and persisted so restarts skip
+    ``list_voices``. Accounts can see different voices, so they don't share
+    entries; concurrent misses for the same entry fetch it once."""
+
+    def __init__(self, path: Optional[str] = VOICE_CATALOG_PATH, ttl: float = VOICE_CATALOG_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.fetch_locks: Dict[str, threading.Lock] = {}
+        # "account|lang_code" -> {"fetched": timestamp, "voices": [...], "choices": {speaker or "ssml": voice}}
+        entries = read(path) if path and os.path.exists(path) else {}
+        self.entries: Dict[str, Dict] = {key: entry for key, entry in entries.items() if "|" in key}
+
+    def _fresh(self, entry: Optional[Dict]) -> bool:
+        return bool(entry) and time.time() - entry["fetched"] < self.ttl
+
+    def _entry(self, client: TextToSpeechClient, credentials: Optional[Dict], lang_code: str) -> Dict:
+        key = f"{ClientPool._key(credentials)}|{lang_code}"
+        with self.lock:
+            entry = self.entries.get(key)
+            fetch_lock = self.fetch_locks.setdefault(key, threading.Lock())
+        if self._fresh(entry):
+            return entry
+        with fetch_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+            if self._fresh(entry):
+                return entry
+            voices = [voice.name for voice in client.list_voices(language_code=lang_code).voices]
+            entry = {"fetched": time.time(), "voices": voices, "choices": {}}
+            with self.lock:
+                self.entries[key] = entry
+        return entry
+
+    def voice(
+        self,
+        client: TextToSpeechClient,
+        lang_code: str,
+        speaker: str,
+        credentials: Optional[Dict] = None,
+        ssml: bool = False,
+    ) -> Optional[str]:
+        """Voice for (language, speaker) under the account of ``credentials``,
+        which ``client`` must belong to. With ``ssml``, the voice used for SSML
+        requests instead, or None if the language has no such voice."""
+        entry = self._entry(client, credentials, lang_code)
+        choice = "ssml" if ssml else speaker
+        with self.lock:
+            if choice in entry["choices"]:
+                return entry["choices"][choice]
+        if ssml:
+            voice_name = choose_ssml_voice(entry["voices"], lang_code)
+        else:
+            voice_name = choose_voice(entry["voices"], lang_code, speaker)
+        with self.lock:
+            entry["choices"][choice] = voice_name
+            if self.path:
+                write(self.path, self.entries, verbose=False)
+        return voice_name
+
+
+def choose_voice(voices: List[str], lang_code: str, speaker: str) -> str:
+    if not voices:
+        logger.error(f"No voices found for language: {lang_code}")
+        raise ValueError(f"No voices found for language: {lang_code}")
+    if f"{lang_code}-Chirp3-HD-Puck" in voices:
+        return f"{lang_code}-Chirp3-HD-Puck" if speaker in ["AP", "MALE"] else f"{lang_code}-Chirp3-HD-Aoede"
+    logger.warning(
+        f"{lang_code} does not have Chirp Voice! Using other voices."
+    )
+    if f"{lang_code}-Wavenet-B" in voices:
+        return f"{lang_code}-Wavenet-B"
+    elif f"{lang_code}-Standard-B" in voices:
+        return f"{lang_code}-Standard-B"
+    raise ValueError(
+        f"Only available voices for {lang_code} are: {voices}"
+    )
+
+
+def choose_ssml_voice(voices: List[str], lang_code: str) -> Optional[str]:
+    """Best voice that supports SSML marks. Chirp voices don't; batched cues
+    are re-voiced by speech-to-speech anyway, so any type will do."""
+    for voice_type in SSML_VOICE_TYPES:
+        names = sorted(voice for voice in voices if f"-{voice_type}-" in voice)
+        if names:
+            return f"{lang_code}-{voice_type}-B" if f"{lang_code}-{voice_type}-B" in names else names[0]
+    return None
+
+
+@lru_cache(maxsize=None)
+def client_pool(beta: bool = False) -> ClientPool:
+    """Pooled v1 clients, or v1beta1 ones (which return SSML mark timepoints)."""
+    return ClientPool(client_class=texttospeech_v1beta1.TextToSpeechClient if beta else TextToSpeechClient)
+
+
+@lru_cache(maxsize=None)
+def voice_catalog() -> VoiceCatalog:
+    return VoiceCatalog()
 
 
 def tts(
     text,
     lang_code,
-    output_file="output.mp3",
+    output_file="output.wav",
     voice_name=None,
     credentials: Optional[Dict] = None,
     **kwargs,
 ):
     speed = kwargs.get("speed", 1.0)
     speaker = kwargs.get("speaker", "AP")
-    if credentials:
-        credentials = service_account.Credentials.from_service_account_info(credentials)
-    CLIENT = TextToSpeechClient(credentials=credentials)
+    client = client_pool().get(credentials)
     input_text = SynthesisInput(text=text)
 
+    # LINEAR16 responses come with a WAV header.
     audio_config = AudioConfig(
-        audio_encoding=AudioEncoding.MP3, speaking_rate=speed
+        audio_encoding=AudioEncoding.LINEAR16,
+        sample_rate_hertz=SAMPLE_RATE,
+        speaking_rate=speed,
     )
     if not voice_name:
-        voices = [
-            voice.name
-            for voice in CLIENT.list_voices(language_code=lang_code).voices
-        ]
-        if not voices:
-            logger.error(f"No voices found for language: {lang_code}")
-            raise ValueError(f"No voices found for language: {lang_code}")
-        if f"{lang_code}-Chirp3-HD-Puck" in voices:
-            voice_name = f"{lang_code}-Chirp3-HD-Puck" if speaker in ["AP", "MALE"] else f"{lang_code}-Chirp3-HD-Aoede"
-        else:
-            logger.warning(
-                f"{lang_code} does not have Chirp Voice! Using other voices."
-            )
-            if f"{lang_code}-Wavenet-B" in voices:
-                voice_name = f"{lang_code}-Wavenet-B"
-            elif f"{lang_code}-Standard-B" in voices:
-                voice_name = f"{lang_code}-Standard-B"
-            else:
-                raise ValueError(
-                    f"Only available voices for {lang_code} are: {voices}"
-                )
+        voice_name = voice_catalog().voice(client, lang_code, speaker, credentials)
     logger.info(f"{voice_name} selected for {lang_code}")
     voice = VoiceSelectionParams(
         language_code=lang_code,
         name=voice_name,
     )
-    response = CLIENT.synthesize_speech(
+    response = client.synthesize_speech(
         request={"input": input_text, "voice": voice, "audio_config": audio_config}
     )
     with open(output_file, "wb") as out:
@@ -62,11 +193,71 @@ def tts(
         print(f'GTTS audio written to "{output_file}"')
 
 
+def voice_name(lang_code, speaker="AP", credentials: Optional[Dict] = None, ssml: bool = False) -> Optional[str]:
+    """Voice ``tts`` picks for (language, speaker), or with ``ssml`` the one
+    ``tts_marks`` uses (None if the language has no SSML voice)."""
+    return voice_catalog().voice(client_pool().get(credentials), lang_code, speaker, credentials, ssml=ssml)
+
+
+def supports_marks(lang_code, speaker="AP", credentials: Optional[Dict] = None) -> bool:
+    """Whether the language has a voice that returns SSML mark timepoints."""
+    return voice_name(lang_code, speaker, credentials, ssml=True) is not None
+
+
+def tts_marks(
+    texts: List[str],
+    lang_code,
+    output_files: List[str],
+    credentials: Optional[Dict] = None,
+    speaker="AP",
+    speeds: Optional[List[float]] = None,
+):
+    """Synthesizes several texts with one SSML request and writes each to its
+    own file, cut at the ``<mark>`` timepoints around it. Each text keeps its
+    own speaking rate through ``<prosody>``. Uses the language's SSML voice,
+    which may differ from the one ``tts`` picks. Nothing is written unless
+    every text's timepoints came back."""
+    speeds = speeds or [1.0] * len(texts)
+    client = client_pool(beta=True).get(credentials)
+    name = voice_catalog().voice(client, lang_code, speaker, credentials, ssml=True)
+    if not name:
+        raise ValueError(f"No voice for {lang_code} supports SSML marks")
+    ssml = "".join(
+        f'<mark name="s{i}"/><prosody rate="{speed * 100:.0f}%">{escape(text)}</prosody>'
+        f'<mark name="e{i}"/><break time="{BATCH_BREAK_MS}ms"/>'
+        for i, (text, speed) in enumerate(zip(texts, speeds))
+    )
+    beta = texttospeech_v1beta1
+    response = client.synthesize_speech(
+        request=beta.SynthesizeSpeechRequest(
+            input=beta.SynthesisInput(ssml=f"<speak>{ssml}</speak>"),
+            voice=beta.VoiceSelectionParams(language_code=lang_code, name=name),
+            audio_config=beta.AudioConfig(
+                audio_encoding=beta.AudioEncoding.LINEAR16, sample_rate_hertz=SAMPLE_RATE
+            ),
+            enable_time_pointing=[beta.SynthesizeSpeechRequest.TimepointType.SSML_MARK],
+        )
+    )
+    marks = {timepoint.mark_name: timepoint.time_seconds for timepoint in response.timepoints}
+    missing = [i for i in range(len(texts)) if f"s{i}" not in marks or f"e{i}" not in marks]
+    if missing:
+        raise ValueError(f"Missing timepoints for texts {missing} of {len(texts)} in SSML response")
+    batch_file = output_files[0].replace(".wav", "_batch.wav")
+    with open(batch_file, "wb") as out:
+        out.write(response.audio_content)
+    samples = read_pcm(batch_file)
+    os.remove(batch_file)
+    for i, output_file in enumerate(output_files):
+        start, end = (round(marks[f"{edge}{i}"] * SAMPLE_RATE) for edge in "se")
+        write_wav(output_file, samples[start:end])
+    print(f"GTTS audio for {len(texts)} texts written with {name}")
+
+
 if __name__ == "__main__":
     text = "ਹਿਰਨਕਸ਼ਯਪ ਸਿਰਫ ਰਾਜਾ ਹੀ ਨਹੀਂ ਸੀ, ਪ੍ਰਹਿਲਾਦ ਦਾ ਬਾਪ ਵੀ ਸੀ ਤੇ ਉਹ ਛੋਟੂ ਨੇ ਕਿਹਾ ਕਿ ਤੁਸੀਂ ਭਾਵੇਂ ਰਾਜਾ ਹੋ, ਭਾਵੇਂ ਬਾਪ ਹੋ ਮੇਰੇ, ਤੁਹਾਡਾ ਸਾਸ਼ਤਾਂ ਨਹੀਂ ਦਵਾਂਗਾ। ਪਹਿਲਾਂ ਤਾਂ ਉਹਨੂੰ ਬਹੁਤ ਲਾਲਚ ਦਿੱਤੇ ਤੇ ਬਹੁਤ ਡਰਾਇਆ ਧਮਕਾਇਆ ਵੀ, ਉਹ ਕਾਹਦੇ ਲਈ ਮੰਨੇ, ਬੋਲਿਆ ਮੈਂ ਨਹੀਂ ਮੰਨਦਾ। ਤਾਂ ਫਿਰ ਭੂਆ ਜੀ ਆਏ, ਭੂਆ ਜੀ ਨੂੰ ਕਿਹਾ ਗਿਆ ਹੈ ਕਿ ਇਹਨੂੰ ਨਾ ਚੁੱਪ ਚਾਪ ਗੋਦ 'ਚ ਬਿਠਾ ਕੇ ਅੱਗ ਤੋਂ ਗੁਜ਼ਰ ਜਾ, ਹੁਣ ਭੂਆ ਜੀ ਉਸਨੂੰ ਲੈ ਕੇ ਅੱਗ ਤੋਂ ਨਿਕਲੀ ਤਾਂ ਕਹਿਣ ਵਾਲੇ ਕਹਿੰਦੇ ਨੇ ਕਿ ਕੁਝ ਐਸੀ ਹਵਾ ਚੱਲੀ ਕਿ ਭੂਆ ਜੀ ਨੇ ਜੋ ਉੱਤੇ ਪਾ ਰੱਖਿਆ ਸੀ, ਉਹ ਉੱਡ ਕੇ ਪ੍ਰਹਿਲਾਦ ਤੇ ਚਲਾ ਗਿਆ ਤਾਂ ਪ੍ਰਹਿਲਾਦ ਤਾਂ ਬਚ ਗਿਆ ਤਾਂ ਭੂਆ ਜੀ ਨੂੰ ਇੰਨੇ ਜ਼ਖਮ ਆਏ ਹੋਣਗੇ, ਇੰਨਾ ਸੜ ਗਈ ਹੋਏਗੀ ਕਿ ਭੂਆ ਜੀ ਫਿਰ ਸਾਫ ਹੋ ਗਏ। ਹੁਣ ਰਾਜੇ ਨੂੰ ਆਇਆ ਗੁੱਸਾ ਤਾਂ ਇੱਕ ਲੋਹੇ ਦਾ ਖੰਭਾ ਬਿਲਕੁਲ ਗਰਮ ਕਰਵਾ ਦਿੱਤਾ, ਛੋਟੂ ਨੂੰ ਡਰ ਤਾਂ ਲੱਗਿਆ ਹੋਵੇਗਾ, ਜੋ ਵੀ ਹੋਇਆ ਹੋਵੇਗਾ ਪਰ ਪ੍ਰਹਿਲਾਦ ਬੋਲਿਆ ਠੀਕ ਹੈ ਪਰ ਤੁਹਾਨੂੰ ਤਾਂ ਨਹੀਂ ਮੰਨ ਲਵਾਂਗਾ ਭਗਵਾਨ ਤਾਂ ਉਹ ਗਿਆ ਉਹਨੇ ਖੰਭੇ ਫਿਰ ਇੱਕ ਜੀਵ ਪ੍ਰਗਟ ਹੋਇਆ ਜੋ ਅੱਧਾ ਸ਼ੇਰ ਸੀ, ਅੱਧਾ ਇਨਸਾਨ ਸੀ। ਤੇ ਸਮਾਂ ਸੂਰਜ ਡੁੱਬਣ ਵਾਲਾ ਹੋ ਰਿਹਾ ਸੀ, ਜਦੋਂ ਨਾ ਤਾਂ ਦਿਨ ਸੀ, ਨਾ ਰਾਤ ਸੀ ਤੇ ਉਹਨੇ ਫੜ ਲਿਆ ਹਿਰਨਕਸ਼ਯਪ ਨੂੰ ਤੇ ਆਪਣੀ ਗੋਦ ਵਿੱਚ ਲੰਮਾ ਪਾ ਲਿਆ ਕਿ ਯਾਨੀ ਨਾ ਤਾਂ ਤੁਸੀਂ ਹਵਾ ਵਿੱਚ ਹੋ, ਨਾ ਤੁਸੀਂ ਜ਼ਮੀਨ ਤੇ ਹੋ, ਨਾਲੇ ਨਾ ਅਸਤਰ ਨਾਲ ਮਰੋਗੇ, ਨਾ ਸ਼ਸਤਰ ਨਾਲ। ਯਾਨੀ ਹੱਥ ਵਿੱਚ ਫੜੀ ਹੋਈ ਚੀਜ਼ ਨਾਲ ਵੀ ਨਹੀਂ ਮਰੋਗੇ ਤੇ ਜੋ ਉੱਡਦੀ ਹੋਈ ਚੀਜ਼ ਆਉਂਦੀ ਹੈ ਉਹਦੇ ਨਾਲ ਵੀ ਨਹੀਂ ਮਰੋਗੇ, ਉਹਨੇ ਕਿਹਾ ਠੀਕ ਹੈ, ਕੁਝ ਹੱਥ ਵਿੱਚ ਫੜ ਨਹੀਂ ਰੱਖਿਆ, ਉਹਨੇ ਮਾਰਿਆ ਆਪਣੇ ਨਹੂਆਂ ਨਾਲ, ਇਸ ਪੂਰੀ ਕਥਾ ਦਾ, ਇਸ ਤਿਉਹਾਰ ਦਾ ਚਿਕਨ ਤੇ ਸ਼ਰਾਬ ਨਾਲ ਕੀ ਸੰਬੰਧ ਹੈ ਮੈਨੂੰ ਸਮਝਾਓ। ਤੁਸੀਂ ਇੱਕ ਛੋਟੇ ਬੱਚੇ ਦੀ ਸਰਲਤਾ ਦੀ ਸਫਲਤਾ ਦਾ ਉਤਸਵ ਮਨਾ ਰਹੇ ਹੋ, ਤੁਸੀਂ ਇੱਕ ਜ਼ਾਲਮ ਬਾਦਸ਼ਾਹ ਦੇ ਹੰਕਾਰ ਤੇ ਚਲਾਕੀ ਦੀ ਹਾਰ ਦਾ ਜਸ਼ਨ ਮਨਾ ਰਹੇ ਹੋ, ਇਹਦੇ 'ਚ ਚਿਕਨ ਤੇ ਦਾਰੂ ਕਿੱਥੋਂ ਆ ਗਏ ਤੇ ਉਹਦੇ 'ਚ ਇਹ ਹੁੱਲੜ ਕਿੱਥੋਂ ਆ ਗਿਆ। ਚਿੱਕੜ ਸੁੱਟਣਾ ਤੇ ਬਕਵਾਸ ਕਰਨਾ ਤੇ ਭਾਬੀ ਨੂੰ ਰੰਗਣਾ, ਭਾਬੀਆਂ ਨਾਲ ਬਹੁਤ ਪਿਆਰ ਹੋ ਜਾਂਦਾ ਹੈ ਹੋਲੀ ਵਾਲੇ ਦਿਨ, ਅੱਧੇ ਸ਼ਹਿਰ ਦੀਆਂ ਔਰਤਾਂ ਉਸ ਦਿਨ ਭਾਬੀ ਹੋ ਜਾਂਦੀਆਂ ਨੇ।"
     lang_code = "pa-IN"
     tts(
         text,
         lang_code,
-        output_file=f"debug/{lang_code}.mp3",
+        output_file=f"debug/{lang_code}.wav",
     )
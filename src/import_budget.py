@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from omegaconf import OmegaConf
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module: str) -> Dict[str, Any]:
+    """Imports ``module`` in a fresh interpreter and reports the time taken
+    and every module it loaded."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)], capture_output=True, text=True, env=env
+    )
+    if result.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check(module: str, seconds: float, forbidden: List[str], repeats: int) -> List[str]:
+    runs = [measure(module) for _ in range(repeats)]
+    best = min(run["seconds"] for run in runs)
+    loaded = set(runs[0]["modules"])
+    problems = [f"{module} imports {name}" for name in forbidden if name in loaded]
+    if best > seconds:
+        problems.append(f"{module} took {best:.2f}s, budget {seconds:.2f}s")
+    print(f"{module:<28} {best:6.2f}s / {seconds:.2f}s  {'FAIL' if problems else 'ok'}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if page imports exceed their cold-start budget.")
+    parser.add_argument("--config", default="configs/import_budget.yaml")
+    args = parser.parse_args()
+
+    config = OmegaConf.load(args.config)
+    problems = []
+    for module, budget in config.modules.items():
+        problems += check(module, budget.seconds, list(budget.forbidden), config.repeats)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import logging
+import os
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from src.answer import AssistantInteraction
+from src.broker import RequestBroker
+from src.fake_openai import FakeOpenAIServer
+from src.metrics import METRICS
+from src.replier import ReplierChat
+from src.utils import read
+
+LOGGER = logging.getLogger("LoadTest")
+
+
+class ResourceSampler:
+    """Samples thread count and resident memory in the background."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.max_threads = 0
+        self.max_rss_mb = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss_mb() -> float:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.max_threads = max(self.max_threads, threading.active_count())
+            self.max_rss_mb = max(self.max_rss_mb, self.rss_mb())
+
+    def __enter__(self) -> "ResourceSampler":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+
+def run_level(call: Callable[[str], Any], inputs: List[str], users: int, requests: int) -> Dict[str, Any]:
+    """Runs ``requests`` calls spread over ``users`` concurrent sessions."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def session(n: int) -> None:
+        nonlocal errors
+        for _ in range(n):
+            start = time.perf_counter()
+            try:
+                call(random.choice(inputs))
+            except Exception as e:
+                LOGGER.error(f"Request failed: {e}")
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    per_user = [requests // users + (i < requests % users) for i in range(users)]
+    with ResourceSampler() as sampler, ThreadPoolExecutor(max_workers=users) as executor:
+        start = time.perf_counter()
+        list(executor.map(session, per_user))
+        elapsed = time.perf_counter() - start
+    percentiles = np.percentile(latencies, [50, 95, 99]) if latencies else [float("nan")] * 3
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentiles[0],
+        "p95": percentiles[1],
+        "p99": percentiles[2],
+        "threads": sampler.max_threads,
+        "rss_mb": sampler.max_rss_mb,
+    }
+
+
+def print_report(name: str, rows: List[Dict[str, Any]]) -> None:
+    print(f"\n{name}")
+    print(
+        f"{'users':>6} {'ok':>5} {'err':>4} {'req/s':>7} {'p50 s':>7} "
+        f"{'p95 s':>7} {'p99 s':>7} {'threads':>8} {'rss MB':>8}"
+    )
+    for r in rows:
+        print(
+            f"{r['users']:>6} {r['requests']:>5} {r['errors']:>4} {r['throughput']:>7.2f} "
+            f"{r['p50']:>7.2f} {r['p95']:>7.2f} {r['p99']:>7.2f} {r['threads']:>8} {r['rss_mb']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test Ask AP and the Replier against a local fake OpenAI server."
+    )
+    parser.add_argument("--target", choices=["askap", "replier", "both"], default="both")
+    parser.add_argument("--users", default="1,4,16,64", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level.")
+    parser.add_argument("--latency-median", type=float, default=2.0, help="Median run latency (s).")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal sigma.")
+    parser.add_argument(
+        "--cache", action="store_true", help="Keep the Ask AP answer cache (repeat questions hit it)."
+    )
+    parser.add_argument(
+        "--broker", action="store_true", help="Send Ask AP requests through the single-flight RequestBroker."
+    )
+    parser.add_argument("--answers", default="data/cached_answers.json")
+    parser.add_argument("--md", default="data/articles_relevant_keys.json")
+    parser.add_argument("--config", default="configs/replier.yaml")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = FakeOpenAIServer(args.latency_median, args.latency_sigma, answers_path=args.answers).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    questions = list(read(args.answers))
+    levels = [int(n) for n in args.users.split(",")]
+
+    targets = {}
+    if args.target in ("askap", "both"):
+        # One shared instance, as with st.cache_resource. Nothing is persisted and,
+        # unless --cache is given, nothing is cached, so every request does a run.
+        assistant = AssistantInteraction("asst_fake", args.md, cache_path=None)
+        assistant.citations.path = None
+        if not args.cache:
+            assistant.cache.max_size = 0
+        if args.broker:
+            targets["Ask AP (RequestBroker.ask)"] = RequestBroker(assistant).ask
+        else:
+            targets["Ask AP (AssistantInteraction.interact)"] = assistant.interact
+    if args.target in ("replier", "both"):
+        chat = ReplierChat(args.config)
+        chat.dedup = None
+        targets["Replier (ReplierChat.reply)"] = chat.reply
+
+    print(
+        f"Fake server latency: median={args.latency_median}s sigma={args.latency_sigma}, "
+        f"{args.requests} requests per level"
+    )
+    try:
+        for name, call in targets.items():
+            print_report(name, [run_level(call, questions, users, args.requests) for users in levels])
+        if coalesced := METRICS.snapshot()["counters"].get("ask_ap_coalesced"):
+            print(f"\nCoalesced requests: {coalesced:g}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+
+QUANTILES = (50, 95, 99)
+
+
+class Histogram:
+    """Rolling window of recent observations plus lifetime count and sum."""
+
+    def __init__(self, window: int):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q: float) -> Optional[float]:
+        return float(np.percentile(self.values, q)) if self.values else None
+
+
+class Metrics:
+    """Process-wide timings, counters and gauges.
+
+    Stage latencies are recorded with ``span`` and exported as p50/p95/p99
+    summaries in Prometheus text format or as JSONL snapshots.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.gauges: Dict[str, float] = {}
+
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(self.window)
+            self.histograms[name].observe(value)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Times the block into the ``<name>_seconds`` histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start)
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            return histogram.percentile(q) if histogram else None
+
+    def count(self, name: str) -> int:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            return histogram.count if histogram else 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "histograms": {
+                    name: {
+                        "count": h.count,
+                        "sum": h.sum,
+                        **{f"p{q}": h.percentile(q) for q in QUANTILES},
+                    }
+                    for name, h in sorted(self.histograms.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name, h in snapshot["histograms"].items():
+            name = _metric_name(name)
+            lines.append(f"# TYPE {name} summary")
+            for q in QUANTILES:
+                if h[f"p{q}"] is not None:
+                    lines.append(f'{name}{{quantile="{q / 100}"}} {h[f"p{q}"]:.6f}')
+            lines.append(f"{name}_sum {h['sum']:.6f}")
+            lines.append(f"{name}_count {h['count']}")
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {_metric_name(name)}_total counter")
+            lines.append(f"{_metric_name(name)}_total {value:g}")
+        for name, value in snapshot["gauges"].items():
+            lines.append(f"# TYPE {_metric_name(name)} gauge")
+            lines.append(f"{_metric_name(name)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self) -> str:
+        return json.dumps(self.snapshot()) + "\n"
+
+    def dump_jsonl(self, path: str) -> None:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+METRICS = Metrics()
@@ -6,17 +6,20 @@ from omegaconf import OmegaConf
 from openai import OpenAI
 
 from logger import logger
+from src.scheduler import INTERACTIVE, scheduler
 
 
 class OpenAIHandler:
     def __init__(self, configs_dir: Optional[str] = "configs"):
-        self.client = OpenAI()
+        # The scheduler retries throttling, timeouts and transient errors itself,
+        # pacing them against the shared quota.
+        self.client = OpenAI(max_retries=0)
         self.configs_dir = configs_dir
         self.translation_config = OmegaConf.load(os.path.join(configs_dir, "translate.yaml"))
         self.transcription_config = OmegaConf.load(os.path.join(configs_dir, "transcribe_no_speaker.yaml"))
         logger.info(f"OpenAIHandler initialized")
     
-    def translate(self, input_text: str, language: str = "English", **kwargs) -> str:
+    def translate(self, input_text: str, language: str = "English", priority: int = INTERACTIVE, **kwargs) -> str:
         if not input_text:
             return ""
         logger.info(f"Translating to {language}: ```{input_text}```")
@@ -29,7 +32,11 @@ class OpenAIHandler:
         system_prompt = config["system_prompt"].format(language=language)  
         
         try:
-            response = self.client.chat.completions.create(
+            response = scheduler().call(
+                "openai",
+                self.client.chat.completions.create,
+                units=(len(system_prompt) + len(input_text)) // 4 + config["max_tokens"],
+                priority=priority,
                 model=config["model"],
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -52,7 +59,7 @@ class OpenAIHandler:
             logger.error(f"An error occurred during translation: {e}")
             raise e
     
-    def transcribe(self, audio_path: str, **kwargs) -> str:
+    def transcribe(self, audio_path: str, priority: int = INTERACTIVE, **kwargs) -> str:
         logger.info(f"Transcribing audio file: {audio_path}")
         
         config = OmegaConf.to_container(self.transcription_config, resolve=True)
@@ -68,7 +75,11 @@ class OpenAIHandler:
 
         try:
             out = (
-                self.client.chat.completions.create(
+                scheduler().call(
+                    "openai",
+                    self.client.chat.completions.create,
+                    units=config["max_completion_tokens"],
+                    priority=priority,
                     model=config["model"],
                     messages=config["messages"],
                     modalities=config["modalities"],
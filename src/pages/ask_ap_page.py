@@ -1,8 +1,11 @@
+import os
 import random
 
 import streamlit as st
 from logger import logger
 from src.answer import AssistantInteraction as AskAPAssistant
+from src.broker import RequestBroker
+from src.metrics import METRICS
 from src.pages.base_page import BasePage
 from src.process import convert_to_embed_url_with_time
 from src.utils import read
@@ -11,9 +14,10 @@ from src.utils import read
 class AskAPPage(BasePage):
     DEFAULT_WIDTH = 60
     SIDE = max((100 - DEFAULT_WIDTH) / 2, 0.01)
+    STREAM = True
     
     def __init__(self):
-        self.assistant = self.get_assistant()
+        self.broker = self.get_broker()
         self.example_questions = self.get_example_questions()        
         if "placeholder_question" not in st.session_state:
             st.session_state.placeholder_question = random.choice(self.example_questions)
@@ -25,9 +29,16 @@ class AskAPPage(BasePage):
     @st.cache_resource
     def get_assistant():
         return AskAPAssistant(
-            "asst_P9VqwgPjaxFvTGsePZcmnGcB", "data/articles_relevant_keys.json"
+            "asst_P9VqwgPjaxFvTGsePZcmnGcB",
+            "data/articles_relevant_keys.json",
+            index_dir=os.environ.get("ASK_AP_INDEX_DIR"),
         )
     
+    @staticmethod
+    @st.cache_resource
+    def get_broker():
+        return RequestBroker(AskAPPage.get_assistant())
+
     @staticmethod
     @st.cache_data
     def get_example_questions() -> list:
@@ -48,48 +59,112 @@ class AskAPPage(BasePage):
             )
             with st.spinner("Loading..."):
                 try:
-                    data = self.assistant.interact(question)
-                    
-                    header = data.get("header", "No header available.")
-                    st.markdown(f"## {header}")
-                    
-                    insights = data.get("insights", [])
-                    for idx, insight in enumerate(insights, start=1):
-                        st.markdown(
-                            f"## {idx}. {insight.get('quote', 'No quote available.')}"
-                        )
-                        if insight.get("article_url"):
-                            _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH, self.SIDE])
-                            container.markdown(
-                                f"""
-                                <div style="text-align: center; margin-bottom: 15px;">
-                                    <a href="{insight['article_url']}" target="_blank" style="font-size: 28px; font-weight: bold; color: #80cbc4;">
-                                        {insight['article_title']}
-                                    </a>
-                                </div>
-                                """,
-                                unsafe_allow_html=True,
-                            )
-                        if insight.get("video_url"):
-                            _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH, self.SIDE])
-                            container.markdown(
-                                f"""
-                                <div style="position: relative; padding-bottom: 56.25%; height: 0; overflow: hidden; margin-bottom: 20px;">
-                                    <iframe
-                                        src="{convert_to_embed_url_with_time(insight['video_url'])}"
-                                        style="position: absolute; top: 0; left: 0; width: 100%; height: 100%;"
-                                        frameborder="0"
-                                        allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture"
-                                        allowfullscreen
-                                    ></iframe>
-                                </div>
-                                """,
-                                unsafe_allow_html=True,
-                            )
+                    if self.STREAM:
+                        self.render_stream(question)
+                    else:
+                        self.render_answer(self.broker.ask(question))
                 except Exception as e:
                     logger.error(f"An error occurred: {e}")
                     st.error(f"An error occurred: {e}")
 
+        self.render_stats()
+
+    def render_stats(self):
+        with st.expander("Stats", expanded=False):
+            snapshot = METRICS.snapshot()
+            st.dataframe(
+                [
+                    {
+                        "stage": name.removeprefix("ask_ap_").removesuffix("_seconds"),
+                        "count": h["count"],
+                        **{
+                            f"{q} (ms)": round(h[q] * 1000, 1) if h[q] is not None else None
+                            for q in ("p50", "p95", "p99")
+                        },
+                    }
+                    for name, h in snapshot["histograms"].items()
+                    if name.startswith("ask_ap_")
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+            st.dataframe(
+                [
+                    {"metric": name, "value": value}
+                    for name, value in {**snapshot["counters"], **snapshot["gauges"]}.items()
+                ],
+                use_container_width=True,
+                hide_index=True,
+            )
+            cols = st.columns(2)
+            cols[0].download_button(
+                "Prometheus", METRICS.to_prometheus(), file_name="metrics.prom", mime="text/plain"
+            )
+            cols[1].download_button(
+                "JSONL", METRICS.to_jsonl(), file_name="metrics.jsonl", mime="application/json"
+            )
+
+    def render_stream(self, question: str):
+        placeholder = st.empty()
+        streamed = {"header": None, "insights": []}
+        final = None
+        with placeholder.container():
+            for kind, payload in self.broker.stream(question):
+                if kind == "header":
+                    streamed["header"] = payload
+                    st.markdown(f"## {payload}")
+                elif kind == "insight":
+                    streamed["insights"].append(payload)
+                    self.render_insight(len(streamed["insights"]), payload)
+                elif kind == "done":
+                    final = payload
+        if final and (
+            final.get("header") != streamed["header"]
+            or final.get("insights", []) != streamed["insights"]
+        ):
+            with placeholder.container():
+                self.render_answer(final)
+
+    def render_answer(self, data: dict):
+        header = data.get("header", "No header available.")
+        st.markdown(f"## {header}")
+
+        insights = data.get("insights", [])
+        for idx, insight in enumerate(insights, start=1):
+            self.render_insight(idx, insight)
+
+    def render_insight(self, idx: int, insight: dict):
+        st.markdown(
+            f"## {idx}. {insight.get('quote', 'No quote available.')}"
+        )
+        if insight.get("article_url"):
+            _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH, self.SIDE])
+            container.markdown(
+                f"""
+                <div style="text-align: center; margin-bottom: 15px;">
+                    <a href="{insight['article_url']}" target="_blank" style="font-size: 28px; font-weight: bold; color: #80cbc4;">
+                        {insight['article_title']}
+                    </a>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
+        if insight.get("video_url"):
+            _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH, self.SIDE])
+            container.markdown(
+                f"""
+                <div style="position: relative; padding-bottom: 56.25%; height: 0; overflow: hidden; margin-bottom: 20px;">
+                    <iframe
+                        src="{convert_to_embed_url_with_time(insight['video_url'])}"
+                        style="position: absolute; top: 0; left: 0; width: 100%; height: 100%;"
+                        frameborder="0"
+                        allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture"
+                        allowfullscreen
+                    ></iframe>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
 
 def render_page():
     AskAPPage.render_page()
\ No newline at end of file
@@ -7,6 +7,7 @@ from src.cmd_utils import download_video, extract_audio
 from src.dub import create_dubbed_video, get_lang_codes
 from src.oai import OpenAIHandler
 from src.pages.base_page import BasePage
+from src.segment_cache import segment_cache
 from src.srt_ui import subtitle_editor
 from src.srt_utils import convert_to_srt
 
@@ -14,6 +15,7 @@ from src.srt_utils import convert_to_srt
 class DubberPage(BasePage):
     DEFAULT_WIDTH = 60
     SIDE = max((100 - DEFAULT_WIDTH) / 2, 0.01)
+    PREVIEW_SECONDS = 10
     
     def __init__(self):
         self.workdir = os.environ.get("WORKDIR", "/tmp")
@@ -27,7 +29,12 @@ class DubberPage(BasePage):
             
         self.rootdir = st.session_state.folder_name
         self.input_path = os.path.join(self.rootdir, "input.mp4")
-        self.audio_path = os.path.join(self.rootdir, "input_audio.mp3")
+        self.audio_path = os.path.join(self.rootdir, "input_audio.wav")
+        legacy_audio_path = os.path.join(self.rootdir, "input_audio.mp3")
+        if not os.path.exists(self.audio_path) and os.path.exists(legacy_audio_path):
+            # Sessions saved before the audio was kept as WAV only have the mp3.
+            if not (os.path.exists(self.input_path) and extract_audio(self.input_path, self.audio_path)):
+                self.audio_path = legacy_audio_path
         self.output_path = os.path.join(self.rootdir, "output.mp4")
         st.session_state["srt_path"] = os.path.join(self.rootdir, "subtitles.srt")
         st.session_state["srt_df_path"] = os.path.join(self.rootdir, "subtitles_df.csv")
@@ -61,6 +68,11 @@ class DubberPage(BasePage):
         
         st.sidebar.markdown("Current Session ID (Copy and save):")
         st.sidebar.code(os.path.basename(st.session_state.folder_name), language="text")
+        stats = segment_cache().stats()
+        st.sidebar.caption(
+            f"Segment cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['bytes'] / 1024**2:.0f}/{stats['max_bytes'] / 1024**2:.0f} MB"
+        )
     
     def upload_video_section(self):
         st.subheader("1. Upload MP4 Video (up to 3 mins)")
@@ -93,12 +105,6 @@ class DubberPage(BasePage):
                     logger.error("Error extracting audio.")
                     st.error("Error extracting audio.")
 
-    @staticmethod
-    @st.cache_data
-    def load_video_data(video_path: str):
-        with open(video_path, "rb") as f:
-            return f.read()
-        
     @staticmethod
     @st.cache_resource
     def get_openai_handler():
@@ -212,7 +218,18 @@ class DubberPage(BasePage):
             if not target_lang:
                 st.error("Select a target language!")
                 return
-                
+
+            _, preview, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH // 2, self.SIDE])
+            preview = preview.empty()
+            shown = False
+
+            def show_preview(mux):
+                # Fragments before the muxer's current position are playable already.
+                nonlocal shown
+                if not shown and mux.seconds >= self.PREVIEW_SECONDS and os.path.exists(mux.partial_path):
+                    preview.video(mux.partial_path)
+                    shown = True
+
             with st.spinner(f"Generating {target_lang} video from {'SRT' if 'srt_content' in st.session_state else 'translated text'}..."):
                 create_dubbed_video(
                     input_video_path=st.session_state["src_vid"],
@@ -222,19 +239,21 @@ class DubberPage(BasePage):
                     output_video_path=self.output_path,
                     input_audio_path=self.audio_path,
                     gtts_creds=dict(st.secrets["GOOGLE_CREDENTIALS"]),
+                    on_progress=show_preview,
                 )
-            
+            preview.empty()
+
         if os.path.exists(self.output_path):
             _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH // 2, self.SIDE])
-            video_data = self.load_video_data(self.output_path)
-            container.video(video_data)
-            st.download_button(
-                label="Download Dubbed Video",
-                data=video_data,
-                file_name="dubbed_video.mp4",
-                mime="video/mp4",
-            )
-    
+            container.video(self.output_path)
+            with open(self.output_path, "rb") as f:
+                st.download_button(
+                    label="Download Dubbed Video",
+                    data=f,
+                    file_name="dubbed_video.mp4",
+                    mime="video/mp4",
+                )
+
     def render(self):
         _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH // 2, self.SIDE])
         with container:
@@ -246,8 +265,7 @@ class DubberPage(BasePage):
         
         if st.session_state.get("src_vid") and os.path.exists(st.session_state["src_vid"]):
             _, container, _ = st.columns([self.SIDE, self.DEFAULT_WIDTH // 2, self.SIDE])
-            video_data = self.load_video_data(st.session_state["src_vid"])
-            container.video(video_data)
+            container.video(st.session_state["src_vid"])
             
             self.transcript_section()
             
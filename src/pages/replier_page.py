@@ -35,8 +35,10 @@ class ReplierPage(BasePage):
                 st.error("Please enter a post first!")
                 return
             
+            placeholder = st.empty()
             with st.spinner("Generating reply..."):
-                st.markdown(f"### {self.chat.reply(post)}", unsafe_allow_html=True)
+                for reply in self.chat.reply_stream(post):
+                    placeholder.markdown(f"### {reply}", unsafe_allow_html=True)
 
 
 def render_page():
@@ -1,9 +1,9 @@
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from openai import OpenAI
-
-from src.utils import read
+from logger import logger
+from src.articles import load_articles
+from src.citations import CitationIndex
 
 
 def convert_to_embed_url_with_time(youtube_url: str) -> str:
@@ -24,17 +24,30 @@ def convert_to_embed_url_with_time(youtube_url: str) -> str:
     return f"https://www.youtube.com/embed/{video_id}{start_time}"
 
 
-def process_citations(client: OpenAI, output):
-    for annotation in output.annotations:
+INSIGHT_PATTERN = re.compile(r"\"([^\"]*?)\"([^\"]*?)<file>(.*?)</file>", flags=re.DOTALL)
+
+
+def replace_citations(index: CitationIndex, text: str, annotations) -> str:
+    annotations = annotations or []
+    filenames = index.resolve(
+        citation.file_id
+        for annotation in annotations
+        if (citation := getattr(annotation, "file_citation", None))
+    )
+    for annotation in annotations:
         if citation := getattr(annotation, "file_citation", None):
-            fname = client.files.retrieve(citation.file_id).filename
-            if annotation.text not in output.value:
+            if annotation.text not in text:
                 print(f"Citation not found in output: {annotation.text}")
-            output.value = output.value.replace(
-                annotation.text, f"<file>{fname}</file>"
+            text = text.replace(
+                annotation.text, f"<file>{filenames[citation.file_id]}</file>"
             )
         else:
             print(f"Unprocessed citation: {annotation}")
+    return text
+
+
+def process_citations(index: CitationIndex, output):
+    output.value = replace_citations(index, output.value, output.annotations)
 
 
 def parse_header(text: str) -> tuple[str, str]:
@@ -46,21 +59,36 @@ def parse_header(text: str) -> tuple[str, str]:
         return (text, "")
 
 
+def normalize_quotes(text: str) -> str:
+    return text.replace("“", '"').replace("”", '"')
+
+
+def build_insight(
+    quote: str, filename: str, articles_md: Dict[str, Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """None if the model cited a file that isn't in ``articles_md``, e.g. a
+    name it made up instead of copying one from the local context."""
+    if filename not in articles_md:
+        logger.warning(f"Skipping quote cited to unknown file: {filename}")
+        return None
+    insight_data = {"quote": f'"{quote.strip()}"'}
+    article_data = articles_md[filename]
+    if video_url := article_data.get("youtubeURL"):
+        insight_data["video_url"] = video_url
+    if article_url := article_data.get("url"):
+        insight_data["article_url"] = article_url
+        insight_data["article_title"] = article_data.get("title", "Article")
+    return insight_data
+
+
 def parse_text(text: str, articles_md: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
-    text = text.replace("“", '"').replace("”", '"')
+    text = normalize_quotes(text)
     header, text_without_header = parse_header(text)
-    pattern = r"\"([^\"]*?)\"([^\"]*?)<file>(.*?)</file>"
-    matches = re.findall(pattern, text_without_header, flags=re.DOTALL)
-    insights = []
-    for quote, _, filename in matches:
-        insight_data = {"quote": f'"{quote.strip()}"'}
-        article_data = articles_md[filename]
-        if video_url := article_data.get("youtubeURL"):
-            insight_data["video_url"] = video_url
-        if article_url := article_data.get("url"):
-            insight_data["article_url"] = article_url
-            insight_data["article_title"] = article_data.get("title", "Article")
-        insights.append(insight_data)
+    insights = [
+        insight
+        for quote, _, filename in INSIGHT_PATTERN.findall(text_without_header)
+        if (insight := build_insight(quote, filename, articles_md))
+    ]
     footer = ""
     if "</file>" in text_without_header:
         footer_section = text_without_header.split("</file>")[-1].strip()
@@ -69,6 +97,48 @@ def parse_text(text: str, articles_md: Dict[str, Dict[str, Any]]) -> Dict[str, A
     return {"header": header, "insights": insights, "footer": footer}
 
 
+class IncrementalParser:
+    """Parses a growing answer text, emitting the header as soon as its colon
+    arrives and each insight as soon as its ``<file>…</file>`` citation closes.
+
+    ``update`` takes the full text received so far; ``close`` returns the same
+    result ``parse_text`` would for the final text.
+    """
+
+    def __init__(self, articles_md: Dict[str, Dict[str, Any]]):
+        self.articles_md = articles_md
+        self.header: Optional[str] = None
+        self.insights: List[Dict[str, Any]] = []
+        self.pos = 0
+
+    def update(self, text: str) -> List[Tuple[str, Any]]:
+        text = normalize_quotes(text)
+        if ":" not in text:
+            return []
+        header, text_without_header = parse_header(text)
+        events = []
+        if self.header is None:
+            self.header = header
+            events.append(("header", header))
+        for match in INSIGHT_PATTERN.finditer(text_without_header, self.pos):
+            quote, _, filename = match.groups()
+            self.pos = match.end()
+            if insight := build_insight(quote, filename, self.articles_md):
+                self.insights.append(insight)
+                events.append(("insight", insight))
+        return events
+
+    def close(self, text: str) -> Dict[str, Any]:
+        return parse_text(text, self.articles_md)
+
+
+def answer_events(answer: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+    yield ("header", answer.get("header", ""))
+    for insight in answer.get("insights", []):
+        yield ("insight", insight)
+    yield ("done", answer)
+
+
 def is_valid_output(parsed_output):
     valid_strings = [
         "मुझे इस बारे में जानकारी नहीं हैं।",
@@ -105,6 +175,6 @@ For more information, "you" can visit the Gita Community page on Acharya Prashan
     print(
         parse_text(
             example_texts[0],
-            read("data/articles_relevant_keys.json"),
+            load_articles("data/articles_relevant_keys.json"),
         )
     )
@@ -0,0 +1,24 @@
+import importlib
+from functools import lru_cache
+from typing import Callable
+
+from logger import logger
+
+# Speech providers by name, as "module:function". Modules (and the SDKs they
+# pull in) are imported on first use, so pages that never synthesize speech
+# don't pay for them at startup.
+PROVIDERS = {
+    "gtts_tts": "src.gtts:tts",
+    "gtts_batch": "src.gtts:tts_marks",
+    "gtts_supports_marks": "src.gtts:supports_marks",
+    "gtts_voice": "src.gtts:voice_name",
+    "elevenlabs_tts": "src.elevenlabs_api:tts",
+    "elevenlabs_sts": "src.elevenlabs_api:sts",
+}
+
+
+@lru_cache(maxsize=None)
+def provider(name: str) -> Callable:
+    module, function = PROVIDERS[name].split(":")
+    logger.info(f"Loading speech provider {name} from {module}")
+    return getattr(importlib.import_module(module), function)
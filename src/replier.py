@@ -1,12 +1,20 @@
+import argparse
 import logging
 import re
-from typing import Any
+import time
+from typing import Any, Dict, Iterator, List, Optional
 
+import numpy as np
 from omegaconf import OmegaConf
 from openai import OpenAI
 
+from src.articles import load_articles
 from src.assistant import BaseAssistant
-from src.process import process_citations, read
+from src.batch import JsonlStore, read_items, run_batch
+from src.citations import CitationIndex
+from src.dedup import NearDuplicateIndex
+from src.metrics import METRICS
+from src.process import process_citations
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,15 +24,26 @@ logging.basicConfig(
 
 
 class ReplierAssistant(BaseAssistant):
-    def __init__(self, assistant_id: str, mapping_file: str):
+    def __init__(
+        self,
+        assistant_id: str,
+        mapping_file: str,
+        config_path: str = "configs/replier.yaml",
+        dedup_path: Optional[str] = "data/replier_assistant_posts.json",
+    ):
         super().__init__(assistant_id)
         logging.info(f"Initializing ReplierAssistant with ID: {assistant_id}")
-        self.mapping = read(mapping_file)
+        self.mapping = load_articles(mapping_file)
         logging.info(f"Mapping file '{mapping_file}' loaded successfully")
+        self.citations = CitationIndex(self.client, articles_md=self.mapping)
+        # Same dedup settings as ReplierChat, but its own past posts.
+        config = OmegaConf.load(config_path)
+        dedup = OmegaConf.to_container(config.dedup) if "dedup" in config else {}
+        self.dedup = NearDuplicateIndex(**{**dedup, "path": dedup_path})
 
     def postprocess(self, output: Any) -> str:
         logging.info("Postprocessing output")
-        process_citations(self.client, output)
+        process_citations(self.citations, output)
         filenames = re.findall(r"<file>(.*?)</file>", output.value)
         logging.debug(f"Extracted filenames from output: {filenames}")
         for filename in filenames:
@@ -37,8 +56,11 @@ class ReplierAssistant(BaseAssistant):
 
     def interact(self, input_text: str) -> str:
         logging.info(f"Interacting with input: {input_text}")
+        if out := self.dedup.get(input_text):
+            return out
         response = self.get_response(input_text)
         out = self.postprocess(response)
+        self.dedup.add(input_text, out)
         logging.info(f"Replier Assistant Output: ```{out}```")
         logging.info("!Replied!")
         return out
@@ -49,32 +71,144 @@ class ReplierChat:
         logging.info(f"Initializing ReplierChat with config path: {config_path}")
         self.client = OpenAI()
         self.config = OmegaConf.load(config_path)
+        # Built once so every request starts with a byte-identical prefix and
+        # the provider's prompt cache can serve the long system message.
+        self.system_message = OmegaConf.to_container(self.config.system_message, resolve=True)
+        self.response_format = OmegaConf.to_container(self.config.response_format, resolve=True)
+        self.dedup = NearDuplicateIndex(**self.config.dedup) if "dedup" in self.config else None
         logging.info(f"Configuration loaded from '{config_path}'")
 
-    def reply(self, input: str):
-        logging.info(f"Generating reply for input: ```{input}```")
-        response = self.client.chat.completions.create(
+    def complete(self, input: str, stream: bool = False) -> Any:
+        return self.client.chat.completions.create(
             model=self.config.model,
             messages=[
-                self.config.system_message,
+                self.system_message,
                 {"role": "user", "content": input},
             ],
-            response_format=self.config.response_format,
+            response_format=self.response_format,
             temperature=self.config.temperature,
             max_completion_tokens=self.config.max_completion_tokens,
             top_p=self.config.top_p,
             frequency_penalty=self.config.frequency_penalty,
             presence_penalty=self.config.presence_penalty,
+            stream=stream,
         )
-        output = response.choices[0].message.content
-        if output.endswith('"') and output.startswith('"'):
-            output = output[1:-1]
+
+    @staticmethod
+    def output(response: Any) -> str:
+        return strip_quotes(response.choices[0].message.content)
+
+    def reply(self, input: str):
+        logging.info(f"Generating reply for input: ```{input}```")
+        if self.dedup and (output := self.dedup.get(input)):
+            return output
+        output = self.output(self.complete(input))
+        if self.dedup:
+            self.dedup.add(input, output)
         logging.info(f"Replier Chat Output: ```{output}```")
         logging.info("Replied!")
         return output
 
+    def reply_stream(self, input: str) -> Iterator[str]:
+        """Yields the reply so far as tokens arrive.
+
+        A leading quote is hidden right away and a trailing one is held back
+        while streaming; the last value yielded equals what ``reply`` returns.
+        """
+        logging.info(f"Streaming reply for input: ```{input}```")
+        if self.dedup and (output := self.dedup.get(input)):
+            yield output
+            return
+        start = time.perf_counter()
+        text, shown = "", None
+        for chunk in self.complete(input, stream=True):
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if not text:
+                METRICS.observe("replier_first_token_seconds", time.perf_counter() - start)
+            text += chunk.choices[0].delta.content
+            visible = text[1:] if text.startswith('"') else text
+            if text.startswith('"') and visible.endswith('"'):
+                visible = visible[:-1]
+            if visible and visible != shown:
+                shown = visible
+                yield visible
+        METRICS.observe("replier_stream_seconds", time.perf_counter() - start)
+        output = strip_quotes(text)
+        if output != shown:
+            yield output
+        if self.dedup and output:
+            self.dedup.add(input, output)
+        logging.info(f"Replier Chat Output: ```{output}```")
+        logging.info("Replied!")
+
+    def reply_record(self, post: str) -> Dict[str, Any]:
+        """Reply plus token usage, for batch runs."""
+        if self.dedup and (reply := self.dedup.get(post)):
+            return {"post": post, "reply": reply, "duplicate": True}
+        response = self.complete(post)
+        usage = response.usage
+        details = getattr(usage, "prompt_tokens_details", None)
+        record = {
+            "post": post,
+            "reply": self.output(response),
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            "completion_tokens": usage.completion_tokens if usage else None,
+        }
+        logging.info(
+            f"Tokens: prompt={record['prompt_tokens']} cached={record['cached_tokens']} "
+            f"completion={record['completion_tokens']}"
+        )
+        if self.dedup:
+            self.dedup.add(post, record["reply"])
+        return record
+
+
+def strip_quotes(output: str) -> str:
+    if output.endswith('"') and output.startswith('"'):
+        output = output[1:-1]
+    return output
+
+
+def batch_summary(records: List[Dict[str, Any]]) -> str:
+    if not records:
+        return "No replies"
+    seconds = [r["seconds"] for r in records]
+    prompt = sum(r.get("prompt_tokens") or 0 for r in records)
+    cached = sum(r.get("cached_tokens") or 0 for r in records)
+    completion = sum(r.get("completion_tokens") or 0 for r in records)
+    duplicates = sum(1 for r in records if r.get("duplicate"))
+    return (
+        f"{len(records)} replies ({duplicates} near-duplicates), prompt_tokens={prompt} (cached={cached}, "
+        f"{cached / max(prompt, 1):.0%}), completion_tokens={completion}, "
+        f"p50={np.percentile(seconds, 50):.2f}s p95={np.percentile(seconds, 95):.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reply to posts with ReplierChat.")
+    parser.add_argument("post", nargs="?", help="Reply to a single post.")
+    parser.add_argument("--batch", help="Posts file (.txt, one per line, .jsonl or .csv).")
+    parser.add_argument("--field", default="post", help="Post column/field for .csv and .jsonl.")
+    parser.add_argument(
+        "--out",
+        default="data/replies.jsonl",
+        help="Crash-safe JSONL store; posts already in it are skipped.",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--config", default="configs/replier.yaml")
+    args = parser.parse_args()
+
+    chat = ReplierChat(args.config)
+    if args.batch:
+        store = JsonlStore(args.out)
+        stats = run_batch(read_items(args.batch, args.field), chat.reply_record, store, workers=args.workers)
+        print(f"Batch finished: {stats}")
+        print(batch_summary(store.records()))
+    else:
+        print(chat.reply(args.post or "स्वम्भू आचार्य प्रशांत एक वामपंथी कीड़ा हैं"))
+
 
 if __name__ == "__main__":
-    chat = ReplierChat("configs/replier.yaml")
-    user_input = "स्वम्भू आचार्य प्रशांत एक वामपंथी कीड़ा हैं"
-    print(chat.reply(user_input))
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from openai import OpenAI
+
+from logger import logger
+from src.articles import load_articles
+from src.utils import read, write
+
+TOKEN_PATTERN = re.compile(r"[\w\u0900-\u0DFF]+")
+SKIP_KEYS = {"id", "url", "youtubeURL"}
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def article_text(data: Any) -> str:
+    if isinstance(data, str):
+        return "" if data.startswith("http") else data
+    if isinstance(data, dict):
+        return "\n\n".join(article_text(v) for k, v in data.items() if k not in SKIP_KEYS)
+    if isinstance(data, list):
+        return "\n\n".join(article_text(v) for v in data)
+    return ""
+
+
+def chunk_text(text: str, max_chars: int = 1200) -> List[str]:
+    passages, current = [], ""
+    for paragraph in (p.strip() for p in text.split("\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def embed(client: OpenAI, texts: List[str], batch_size: int = 500) -> np.ndarray:
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts[i : i + batch_size])
+        vectors.extend(item.embedding for item in response.data)
+        logger.info(f"Embedded {min(i + batch_size, len(texts))}/{len(texts)} passages")
+    vectors = np.array(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class RetrievalIndex:
+    """Local hybrid (BM25 + dense) index over the article passages.
+
+    Everything but the vocabulary is a flat ``.npy`` array loaded with
+    ``mmap_mode="r"``, so opening the index is cheap and processes share pages.
+    Results are article filenames, i.e. keys of ``articles_relevant_keys.json``.
+    """
+
+    RRF_K = 60
+    CANDIDATES = 100
+
+    def __init__(self, index_dir: str, client: Optional[OpenAI] = None):
+        self.index_dir = index_dir
+        self.client = client
+        meta = read(os.path.join(index_dir, "meta.json"))
+        self.filenames: List[str] = meta["filenames"]
+        self.vocab: Dict[str, int] = read(os.path.join(index_dir, "vocab.json"))
+        load = lambda name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        self.indptr = load("postings_indptr")
+        self.postings = load("postings_docs")
+        self.weights = load("postings_weights")
+        self.passage_doc = load("passage_doc")
+        self.passage_offsets = load("passage_offsets")
+        self.passages = np.memmap(os.path.join(index_dir, "passages.bin"), dtype=np.uint8, mode="r")
+        dense_path = os.path.join(index_dir, "embeddings.npy")
+        self.embeddings = load("embeddings") if client and os.path.exists(dense_path) else None
+        logger.info(
+            f"Loaded retrieval index {index_dir}: {len(self.passage_doc)} passages, "
+            f"{len(self.filenames)} articles, dense={'yes' if self.embeddings is not None else 'no'}"
+        )
+
+    def passage(self, passage_id: int) -> str:
+        start, end = self.passage_offsets[passage_id], self.passage_offsets[passage_id + 1]
+        return bytes(self.passages[start:end]).decode("utf-8")
+
+    def bm25_scores(self, queries: List[str]) -> np.ndarray:
+        scores = np.zeros((len(queries), len(self.passage_doc)), dtype=np.float32)
+        for i, query in enumerate(queries):
+            term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+            if not term_ids:
+                continue
+            docs = np.concatenate([self.postings[self.indptr[t] : self.indptr[t + 1]] for t in term_ids])
+            weights = np.concatenate([self.weights[self.indptr[t] : self.indptr[t + 1]] for t in term_ids])
+            scores[i] = np.bincount(docs, weights=weights, minlength=len(self.passage_doc))
+        return scores
+
+    def dense_scores(self, queries: List[str]) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        return embed(self.client, queries) @ self.embeddings.T
+
+    def _ranked(self, scores: np.ndarray) -> np.ndarray:
+        n = min(self.CANDIDATES, len(scores))
+        candidates = np.argpartition(-scores, n - 1)[:n]
+        candidates = candidates[scores[candidates] > 0]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def search_batch(self, queries: List[str], k: int = 5, mode: str = "hybrid") -> List[List[Dict[str, Any]]]:
+        """Top-k articles per query, best passage first. ``mode`` is bm25, dense or hybrid."""
+        bm25 = self.bm25_scores(queries) if mode in ("bm25", "hybrid") else None
+        dense = self.dense_scores(queries) if mode in ("dense", "hybrid") else None
+        results = []
+        for i in range(len(queries)):
+            fused: Dict[int, float] = {}
+            for scores in (bm25, dense):
+                if scores is None:
+                    continue
+                for rank, passage_id in enumerate(self._ranked(scores[i])):
+                    fused[int(passage_id)] = fused.get(int(passage_id), 0.0) + 1 / (self.RRF_K + rank)
+            hits, seen = [], set()
+            for passage_id, score in sorted(fused.items(), key=lambda item: -item[1]):
+                filename = self.filenames[self.passage_doc[passage_id]]
+                if filename in seen:
+                    continue
+                seen.add(filename)
+                hits.append({"filename": filename, "score": score, "passage": self.passage(passage_id)})
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results
+
+    def search(self, query: str, k: int = 5, mode: str = "hybrid") -> List[Dict[str, Any]]:
+        return self.search_batch([query], k=k, mode=mode)[0]
+
+    @staticmethod
+    def build(
+        articles_dir: str,
+        index_dir: str,
+        client: Optional[OpenAI] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        filenames = sorted(f for f in os.listdir(articles_dir) if f.endswith(".json"))
+        logger.info(f"Indexing {len(filenames)} articles from {articles_dir}")
+        passages, passage_doc = [], []
+        for doc_id, filename in enumerate(filenames):
+            with open(os.path.join(articles_dir, filename), "r", encoding="utf-8") as f:
+                text = article_text(json.load(f))
+            for passage in chunk_text(text):
+                passages.append(passage)
+                passage_doc.append(doc_id)
+
+        vocab: Dict[str, int] = {}
+        terms, docs, tfs = [], [], []
+        doc_len = np.zeros(len(passages), dtype=np.float32)
+        for passage_id, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            doc_len[passage_id] = sum(counts.values())
+            for term, tf in counts.items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                docs.append(passage_id)
+                tfs.append(tf)
+        terms = np.array(terms, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        terms = terms[order]
+        docs = np.array(docs, dtype=np.int32)[order]
+        tfs = np.array(tfs, dtype=np.float32)[order]
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=indptr[1:])
+        df = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((len(passages) - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * doc_len[docs] / doc_len.mean())
+        weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+        encoded = [p.encode("utf-8") for p in passages]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in encoded], out=offsets[1:])
+        with open(os.path.join(index_dir, "passages.bin"), "wb") as f:
+            for p in encoded:
+                f.write(p)
+
+        save = lambda name, array: np.save(os.path.join(index_dir, f"{name}.npy"), array)
+        save("postings_indptr", indptr)
+        save("postings_docs", docs)
+        save("postings_weights", weights)
+        save("passage_doc", np.array(passage_doc, dtype=np.int32))
+        save("passage_offsets", offsets)
+        if client is not None:
+            save("embeddings", embed(client, passages))
+        write(os.path.join(index_dir, "vocab.json"), vocab, verbose=False)
+        write(os.path.join(index_dir, "meta.json"), {"filenames": filenames, "k1": k1, "b": b}, verbose=False)
+        logger.info(f"Index written to {index_dir}: {len(passages)} passages, {len(vocab)} terms")
+
+
+def benchmark(index: RetrievalIndex, answers_path: str, k: int) -> None:
+    """Recall@k of the articles cited in cached answers, and query latency."""
+    articles = load_articles()
+    questions, cited = [], []
+    for question, answer in read(answers_path).items():
+        urls = {i["article_url"] for i in answer.get("insights", []) if i.get("article_url")}
+        filenames = {f for url in urls if (f := articles.filename_for_url(url))}
+        if filenames:
+            questions.append(question)
+            cited.append(filenames)
+    print(f"{len(questions)} questions with citations, k={k}")
+    modes = ["bm25"] + (["dense", "hybrid"] if index.embeddings is not None else [])
+    for mode in modes:
+        latencies = []
+        recalls = []
+        for question, expected in zip(questions, cited):
+            start = time.perf_counter()
+            hits = index.search(question, k=k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & {h["filename"] for h in hits}) / len(expected))
+        start = time.perf_counter()
+        index.search_batch(questions, k=k, mode=mode)
+        batch_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"{mode:>6}: recall@{k}={np.mean(recalls):.3f} "
+            f"p50={np.percentile(latencies, 50):.1f}ms p95={np.percentile(latencies, 95):.1f}ms "
+            f"batch={batch_ms / len(questions):.1f}ms/query"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local article retrieval index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build the index offline.")
+    build_parser.add_argument("--articles", default="data/new_articles")
+    build_parser.add_argument("--index", default="data/index")
+    build_parser.add_argument("--no-dense", action="store_true", help="Skip embeddings.")
+    bench_parser = subparsers.add_parser("bench", help="Recall/latency against cached answers.")
+    bench_parser.add_argument("--index", default="data/index")
+    bench_parser.add_argument("--answers", default="data/cached_answers.json")
+    bench_parser.add_argument("--k", type=int, default=5)
+    bench_parser.add_argument("--no-dense", action="store_true")
+    args = parser.parse_args()
+
+    client = None if args.no_dense else OpenAI()
+    if args.command == "build":
+        RetrievalIndex.build(args.articles, args.index, client)
+    else:
+        benchmark(RetrievalIndex(args.index, client), args.answers, args.k)
+
+
+if __name__ == "__main__":
+    main()
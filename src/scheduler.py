@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple
+
+from omegaconf import OmegaConf
+
+from logger import logger
+from src.metrics import METRICS
+
+CONFIG_PATH = "configs/rate_limits.yaml"
+# Priority lanes: lower goes first.
+INTERACTIVE = 0
+BULK = 1
+# Throttling: the whole provider pauses before retrying.
+RETRY_STATUSES = {429, 503}
+# Transient failures of a single request: only that call backs off and retries.
+TRANSIENT_STATUSES = {408, 409, 500, 502, 504}
+# Connection errors and timeouts of the OpenAI SDK, httpx, requests and the
+# standard library, matched by class name so no SDK has to be imported here.
+TRANSIENT_ERRORS = {"APIConnectionError", "TransportError", "ConnectionError", "Timeout", "TimeoutError"}
+
+
+class TokenBucket:
+    """Refills continuously at ``per_minute`` up to one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` tokens are available (capped at capacity)."""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderLimiter:
+    """Admits calls to one provider within its request and unit buckets and
+    concurrency, in priority order (FIFO within a lane). A 429 from any
+    caller pauses the whole provider, so sessions back off together."""
+
+    def __init__(self, name: str, requests_per_minute: float, units_per_minute: float, concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.units = TokenBucket(units_per_minute)
+        self.concurrency = concurrency
+        self.active = 0
+        self.paused_until = 0.0
+        self.cond = threading.Condition()
+        self.queue: List[Tuple[int, int]] = []
+        self.seq = itertools.count()
+
+    def _gauges(self) -> None:
+        METRICS.set_gauge(f"rate_limit_{self.name}_queue", len(self.queue))
+        METRICS.set_gauge(f"rate_limit_{self.name}_in_flight", self.active)
+
+    def acquire(self, units: float = 0, priority: int = BULK) -> None:
+        start = time.monotonic()
+        with self.cond:
+            ticket = (priority, next(self.seq))
+            heapq.heappush(self.queue, ticket)
+            self._gauges()
+            while True:
+                timeout = None
+                if self.queue[0] == ticket and self.active < self.concurrency:
+                    timeout = max(
+                        self.paused_until - time.monotonic(),
+                        self.requests.wait_time(1),
+                        self.units.wait_time(units),
+                    )
+                    if timeout <= 0:
+                        break
+                self.cond.wait(timeout)
+            heapq.heappop(self.queue)
+            self.requests.take(1)
+            self.units.take(units)
+            self.active += 1
+            self._gauges()
+            # The next caller in line may be admissible too.
+            self.cond.notify_all()
+        METRICS.observe(f"rate_limit_{self.name}_wait_seconds", time.monotonic() - start)
+
+    def release(self) -> None:
+        with self.cond:
+            self.active -= 1
+            self._gauges()
+            self.cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status of an SDK error (OpenAI, ElevenLabs, Google API core)."""
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(response, "status_code", None), getattr(error, "code", None)):
+        try:
+            return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def transient(error: Exception) -> bool:
+    if error_status(error) in TRANSIENT_STATUSES:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(error, "headers", None) or getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Scheduler:
+    """One ``ProviderLimiter`` per provider in ``configs/rate_limits.yaml``.
+
+    ``call`` waits for admission, runs the request and, on a 429/503, pauses
+    the provider for the server's Retry-After (or an exponential backoff) and
+    retries with jitter instead of failing the work done so far. Connection
+    errors, timeouts and other transient statuses are retried with the same
+    backoff, without holding back other callers. SDK clients should not retry
+    on their own.
+    """
+
+    def __init__(self, config_path: str = CONFIG_PATH):
+        config = OmegaConf.load(config_path)
+        self.limiters = {name: ProviderLimiter(name, **limits) for name, limits in config.providers.items()}
+        self.retries = config.retries
+
+    def call(
+        self, provider: str, fn: Callable, *args, units: float = 0, priority: int = BULK, **kwargs
+    ) -> Any:
+        limiter = self.limiters[provider]
+        for attempt in range(1, self.retries.max_attempts + 1):
+            limiter.acquire(units, priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                throttled = error_status(e) in RETRY_STATUSES
+                if not (throttled or transient(e)) or attempt == self.retries.max_attempts:
+                    raise
+                backoff = min(self.retries.max_delay, self.retries.base_delay * 2 ** (attempt - 1))
+                delay = retry_after(e) or backoff
+                if throttled:
+                    limiter.pause(delay)
+                    METRICS.inc(f"rate_limit_{provider}_retries")
+                    logger.warning(f"{provider} throttled ({e}), retry {attempt} in {delay:.1f}s")
+                else:
+                    METRICS.inc(f"rate_limit_{provider}_transient_retries")
+                    logger.warning(f"{provider} request failed ({e!r}), retry {attempt} in {delay:.1f}s")
+            finally:
+                limiter.release()
+            if throttled:
+                # The pause holds everyone back; jitter spreads the retries after it.
+                time.sleep(random.uniform(0, min(delay, self.retries.base_delay)))
+            else:
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+@lru_cache(maxsize=None)
+def scheduler() -> Scheduler:
+    return Scheduler()
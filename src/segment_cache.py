@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict
+
+from logger import logger
+from src.metrics import METRICS
+
+CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", "data/segment_cache")
+MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_BYTES", 2 * 1024**3))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class SegmentCache:
+    """Content-addressed store of synthesized segments shared by all sessions.
+
+    Files are keyed on a hash of the normalized text and everything else that
+    changes the audio (language, provider, voice, model, speed), written
+    atomically, and evicted least recently used first once the directory
+    grows past ``max_bytes``. File mtimes record last use, so several app
+    processes can share one directory.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._files())
+        METRICS.set_gauge("segment_cache_bytes", self.size)
+
+    @staticmethod
+    def key(text: str, **fields: Any) -> str:
+        data = {"text": normalize_text(text), **fields}
+        return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def path(self, key: str, ext: str = ".wav") -> str:
+        return os.path.join(self.root, key[:2], f"{key}{ext}")
+
+    def _files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(".tmp"):
+                    yield os.path.join(dirpath, filename)
+
+    def get(self, key: str, output_file: str) -> bool:
+        """Copies the cached audio for ``key`` to ``output_file`` if present."""
+        path = self.path(key, os.path.splitext(output_file)[1])
+        try:
+            shutil.copyfile(path, output_file)
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            METRICS.inc("segment_cache_misses")
+            return False
+        with self.lock:
+            self.hits += 1
+        METRICS.inc("segment_cache_hits")
+        logger.info(f"Segment cache hit: {key[:12]}")
+        return True
+
+    def put(self, key: str, source_file: str) -> None:
+        path = self.path(key, os.path.splitext(source_file)[1])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_file, tmp_path)
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size += os.path.getsize(path) - replaced
+            if self.size > self.max_bytes:
+                self._evict()
+            METRICS.set_gauge("segment_cache_bytes", self.size)
+
+    def _evict(self) -> None:
+        """Drops least recently used files until 90% of the budget is left."""
+        files = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        self.size = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            removed += 1
+        METRICS.inc("segment_cache_evictions", removed)
+        logger.info(f"Segment cache evicted {removed} files, {self.size} bytes left")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+@lru_cache(maxsize=None)
+def segment_cache() -> SegmentCache:
+    """The process-wide cache, created on first use."""
+    return SegmentCache()
+
+
+if __name__ == "__main__":
+    cache = segment_cache()
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        shutil.rmtree(cache.root)
+        print(f"Cleared {cache.root}")
+    else:
+        print(f"{cache.root}: {cache.size / 1024**2:.1f} MB of {cache.max_bytes / 1024**2:.0f} MB")
@@ -1,7 +1,6 @@
+import csv
 import os
 
-import pandas as pd
-
 import streamlit as st
 from src.dub import SPEAKERS, dub_single_segment, get_lang_codes
 from src.srt_utils import convert_time, convert_to_srt
@@ -30,10 +29,8 @@ def subtitle_editor():
     """, unsafe_allow_html=True)
     if "subtitles" not in st.session_state:
         if os.path.exists(st.session_state.srt_df_path):
-            try:
-                st.session_state.subtitles = pd.read_csv(st.session_state.srt_df_path).to_dict(orient="records")
-            except pd.errors.EmptyDataError:
-                st.session_state.subtitles = []
+            with open(st.session_state.srt_df_path, newline="") as f:
+                st.session_state.subtitles = list(csv.DictReader(f))
         else:
             st.session_state.subtitles = []
 
@@ -105,5 +102,4 @@ def subtitle_editor():
         st.rerun()
     
     st.write("##### Saved SRT")
-    df = pd.DataFrame(st.session_state.subtitles)
-    st.dataframe(df, use_container_width=True, hide_index=True)
\ No newline at end of file
+    st.dataframe(st.session_state.subtitles, use_container_width=True, hide_index=True)
\ No newline at end of file
@@ -1,7 +1,9 @@
-import pandas as pd
+import csv
 
 from logger import logger
 
+CSV_FIELDS = ["start", "end", "text", "speaker"]
+
 
 def convert_time(time_str: str, to_ms: bool = False, segment: int | None = None) -> str | int | None:
     if not time_str:
@@ -50,7 +52,10 @@ def convert_to_srt(session_state) -> tuple[str, list[dict]]:
             'speaker': subtitle['speaker'],
         })
     srt_string = "\n".join(srt_content)
-    pd.DataFrame(df_data).to_csv(session_state.srt_df_path, index=False)
+    with open(session_state.srt_df_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(df_data)
     with open(session_state.srt_path, "w") as f:
         f.write(srt_string)
     logger.info(f"SRT length {len(srt_content)} written to {session_state.srt_path}") if len(srt_content) > 0 else None
@@ -0,0 +1,53 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FRAME_MS = 40
+TOLERANCE_MS = 10
+
+
+def time_stretch(
+    samples: np.ndarray,
+    speed: float,
+    sample_rate: int,
+    frame_ms: float = FRAME_MS,
+    tolerance_ms: float = TOLERANCE_MS,
+) -> np.ndarray:
+    """Changes the tempo of ``samples`` by ``speed`` without changing pitch (WSOLA).
+
+    ``samples`` is (n,) or (n, channels). Output frames are overlap-added
+    with a Hann window at a fixed hop; each input frame is taken from within
+    ``tolerance_ms`` of its nominal position, wherever it best continues the
+    previous frame, which avoids the phasing artefacts of plain OLA.
+    """
+    mono_input = samples.ndim == 1
+    x = samples[:, None] if mono_input else samples
+    x = x.astype(np.float32)
+    n = len(x)
+    if speed == 1.0 or n == 0:
+        return samples.copy()
+
+    frame = max(2, int(sample_rate * frame_ms / 1000)) // 2 * 2
+    hop = frame // 2
+    tol = int(sample_rate * tolerance_ms / 1000)
+    # The similarity search runs on every step-th sample (about 8 kHz).
+    step = max(1, sample_rate // 8000)
+    window = np.hanning(frame + 1)[:-1].astype(np.float32)
+    out_len = int(np.ceil(n / speed))
+    frames = out_len // hop + 1
+    nominal = np.round(np.arange(frames + 1) * hop * speed).astype(np.int64)
+
+    # Positions below are in original coordinates; xp is x shifted by tol.
+    xp = np.pad(x, ((tol, int(nominal[-1]) + frame + hop + 2 * tol - n), (0, 0)))
+    mono = xp.mean(axis=1)
+    y = np.zeros((frames * hop + frame, x.shape[1]), dtype=np.float32)
+    weights = np.zeros(frames * hop + frame, dtype=np.float32)
+    delta = 0
+    for k in range(frames):
+        pos = nominal[k] + delta + tol
+        y[k * hop : k * hop + frame] += xp[pos : pos + frame] * window[:, None]
+        weights[k * hop : k * hop + frame] += window
+        natural = mono[pos + hop : pos + hop + frame : step]
+        region = mono[nominal[k + 1] : nominal[k + 1] + 2 * tol + frame : step]
+        delta = int(np.argmax(sliding_window_view(region, len(natural)) @ natural)) * step - tol
+    y = y[:out_len] / np.maximum(weights[:out_len, None], 1e-3)
+    return y[:, 0] if mono_input else y
@@ -1,8 +1,6 @@
-from elevenlabs import ElevenLabs
-
+from src.elevenlabs_api import client
 from src.utils import write
 
-CLIENT = ElevenLabs()
 def transcribe_audio(audio_path, model_id='scribe_v1', language_code=None):
     with open(audio_path, 'rb') as f:
         audio = f.read()
@@ -19,7 +17,7 @@ def transcribe_audio(audio_path, model_id='scribe_v1', language_code=None):
     if language_code is not None:
         params['language_code'] = language_code
         
-    return CLIENT.speech_to_text.convert(**params)
+    return client().speech_to_text.convert(**params)
 
 def identify_segments(transcription, pause_threshold=0.5):
     segments = []
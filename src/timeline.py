@@ -0,0 +1,226 @@
+import os
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import ffmpeg
+import numpy as np
+
+from logger import logger
+from src.audio_io import CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH, iter_pcm, read_pcm, wav_info, write_pcm
+from src.metrics import METRICS
+from src.utils import read, write
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+
+class Timeline:
+    """Audio track assembled by placing segments at absolute offsets.
+
+    Segments are registered with ``add`` (as files or ``AudioSegment``s) and
+    only decoded while the chunk being rendered overlaps them. ``render`` mixes
+    each chunk in a float32 buffer, so overlapping segments are summed rather
+    than pushed back, and writes the PCM as WAV or pipes it into a single
+    ffmpeg encode. A ``sink`` can consume the same PCM as it is produced. Work is
+    linear in the track length and memory is bounded by ``CHUNK_MS`` plus the
+    segments overlapping it.
+
+    When the output is WAV and every segment is a WAV file, a manifest of the
+    placements is saved next to it. The next render of the same track diffs
+    against that manifest and only re-mixes the ranges where segments were
+    added, removed or changed, writing them into the existing file in place.
+    """
+
+    CHUNK_MS = 5_000
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.placements: List[Tuple[int, Union[str, "AudioSegment", Future]]] = []
+
+    def add(self, start_ms: int, audio: Union[str, "AudioSegment", Future]) -> None:
+        """Places ``audio`` at ``start_ms``. It may be a ``Future`` of a file or
+        segment still being produced; the mix only waits for it when it
+        reaches the chunk where the audio starts."""
+        self.placements.append((self.to_samples(start_ms), audio))
+
+    def resolve(self, i: int) -> Union[str, "AudioSegment"]:
+        start, audio = self.placements[i]
+        if isinstance(audio, Future):
+            audio = audio.result()
+            self.placements[i] = (start, audio)
+        return audio
+
+    def to_samples(self, ms: float) -> int:
+        return int(round(ms * self.sample_rate / 1000))
+
+    def decode(self, audio: Union[str, "AudioSegment"]) -> np.ndarray:
+        if isinstance(audio, str):
+            return read_pcm(audio, self.sample_rate, self.channels)
+        audio = audio.set_frame_rate(self.sample_rate).set_channels(self.channels).set_sample_width(2)
+        samples = np.frombuffer(audio.raw_data, dtype=np.int16).reshape(-1, self.channels)
+        return samples.astype(np.float32)
+
+    @staticmethod
+    def manifest_path(output_path: str) -> str:
+        return f"{os.path.splitext(output_path)[0]}_timeline.json"
+
+    def manifest(self, duration_ms: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Placements as (start, path, mtime, frames), read from WAV headers.
+        None if a segment is not a WAV file in the timeline's format."""
+        placements = []
+        for i, (start, _) in enumerate(self.placements):
+            audio = self.resolve(i)
+            if not isinstance(audio, str) or not audio.endswith(".wav"):
+                return None
+            info = wav_info(audio)
+            if (info.sample_rate, info.channels, info.sample_width) != (self.sample_rate, self.channels, SAMPLE_WIDTH):
+                return None
+            placements.append([start, audio, os.stat(audio).st_mtime_ns, info.frames])
+        total = max([self.to_samples(duration_ms) if duration_ms else 0] + [p[0] + p[3] for p in placements])
+        return {"sample_rate": self.sample_rate, "channels": self.channels, "total": total, "placements": placements}
+
+    def render(
+        self, output_path: str, duration_ms: Optional[float] = None, sink: Optional[Callable[[bytes], None]] = None
+    ) -> List[int]:
+        """Encodes the mix to ``output_path`` (format from its extension).
+
+        The track lasts ``duration_ms`` or until the last segment ends, whichever
+        is longer. ``sink`` receives the whole track as 16-bit PCM while it is
+        mixed, or after patching; it is not called if the track is unchanged.
+        A full render streams chunks as soon as the segments they need are
+        ready; patching needs every segment first. Returns each segment's
+        length in ms, in the order added.
+        """
+        if not output_path.endswith(".wav"):
+            return self.render_full(output_path, duration_ms, sink)
+        manifest_path = self.manifest_path(output_path)
+        if os.path.exists(manifest_path):
+            previous = read(manifest_path)
+            manifest = self.manifest(duration_ms)
+            if manifest and self.can_patch(output_path, previous, manifest):
+                os.remove(manifest_path)
+                if self.patch(output_path, previous, manifest) and sink:
+                    for data in iter_pcm(output_path, self.to_samples(self.CHUNK_MS)):
+                        sink(data)
+                write(manifest_path, manifest, verbose=False)
+                return [round(p[3] * 1000 / self.sample_rate) for p in manifest["placements"]]
+            os.remove(manifest_path)
+        lengths = self.render_full(output_path, duration_ms, sink)
+        if manifest := self.manifest(duration_ms):
+            write(manifest_path, manifest, verbose=False)
+        return lengths
+
+    def can_patch(self, output_path: str, previous: Dict[str, Any], manifest: Dict[str, Any]) -> bool:
+        if not os.path.exists(output_path):
+            return False
+        keys = ("sample_rate", "channels", "total")
+        if any(previous[key] != manifest[key] for key in keys):
+            return False
+        info = wav_info(output_path)
+        return (info.sample_rate, info.channels, info.frames) == (self.sample_rate, self.channels, manifest["total"])
+
+    def patch(self, output_path: str, previous: Dict[str, Any], manifest: Dict[str, Any]) -> bool:
+        """Re-mixes only the sample ranges covered by segments that differ
+        between ``previous`` and ``manifest`` and overwrites them in place.
+        Returns whether anything changed."""
+        changed = {tuple(p) for p in previous["placements"]} ^ {tuple(p) for p in manifest["placements"]}
+        dirty: List[List[int]] = []
+        for lo, hi in sorted((start, start + frames) for start, _, _, frames in changed):
+            if dirty and lo <= dirty[-1][1]:
+                dirty[-1][1] = max(dirty[-1][1], hi)
+            else:
+                dirty.append([lo, hi])
+        if not dirty:
+            logger.info(f"Timeline unchanged, keeping {output_path}")
+            return False
+        chunk = self.to_samples(self.CHUNK_MS)
+        frame_bytes = self.channels * SAMPLE_WIDTH
+        data_offset = wav_info(output_path).data_offset
+        with open(output_path, "r+b") as f:
+            for lo, hi in dirty:
+                decoded: Dict[str, np.ndarray] = {}
+                for pos in range(lo, hi, chunk):
+                    end = min(pos + chunk, hi)
+                    buffer = np.zeros((end - pos, self.channels), dtype=np.float32)
+                    for start, path, _, frames in manifest["placements"]:
+                        if start < end and start + frames > pos:
+                            if path not in decoded:
+                                decoded[path] = self.decode(path)
+                            samples = decoded[path]
+                            a, b = max(pos, start), min(end, start + len(samples))
+                            if a < b:
+                                buffer[a - pos : b - pos] += samples[a - start : b - start]
+                    f.seek(data_offset + pos * frame_bytes)
+                    f.write(np.clip(buffer, -32768, 32767).astype(np.int16).tobytes())
+        dirty_ms = sum(hi - lo for lo, hi in dirty) * 1000 / self.sample_rate
+        METRICS.inc("dub_render_patched_ms", dirty_ms)
+        logger.info(f"Patched {len(changed)} changed segments, {dirty_ms / 1000:.1f}s of {output_path}")
+        return True
+
+    def mix(self, duration_ms: Optional[float], lengths: List[int]) -> Iterator[bytes]:
+        """Yields the mixed track as 16-bit PCM, ``CHUNK_MS`` at a time, and fills
+        in ``lengths`` (ms) as segments are decoded."""
+        order = sorted(range(len(self.placements)), key=lambda i: self.placements[i][0])
+        chunk = self.to_samples(self.CHUNK_MS)
+        total = self.to_samples(duration_ms) if duration_ms else 0
+        active: List[Tuple[int, np.ndarray]] = []
+        pos, next_idx = 0, 0
+        while True:
+            while next_idx < len(order) and self.placements[order[next_idx]][0] < pos + chunk:
+                i = order[next_idx]
+                start = self.placements[i][0]
+                samples = self.decode(self.resolve(i))
+                lengths[i] = round(len(samples) * 1000 / self.sample_rate)
+                total = max(total, start + len(samples))
+                active.append((start, samples))
+                next_idx += 1
+            if pos >= total and next_idx == len(order):
+                break
+            end = pos + chunk if next_idx < len(order) else min(pos + chunk, total)
+            buffer = np.zeros((end - pos, self.channels), dtype=np.float32)
+            for start, samples in active:
+                lo, hi = max(pos, start), min(end, start + len(samples))
+                if lo < hi:
+                    buffer[lo - pos : hi - pos] += samples[lo - start : hi - start]
+            active = [(start, samples) for start, samples in active if start + len(samples) > end]
+            yield np.clip(buffer, -32768, 32767).astype(np.int16).tobytes()
+            pos = end
+
+    def render_full(
+        self, output_path: str, duration_ms: Optional[float] = None, sink: Optional[Callable[[bytes], None]] = None
+    ) -> List[int]:
+        """Mixes the whole track. WAV is written directly; other formats are
+        encoded by ffmpeg from PCM on its stdin."""
+        lengths = [0] * len(self.placements)
+        written = 0
+
+        def chunks() -> Iterator[bytes]:
+            nonlocal written
+            for data in self.mix(duration_ms, lengths):
+                if sink:
+                    sink(data)
+                written += len(data)
+                yield data
+
+        if output_path.endswith(".wav"):
+            write_pcm(output_path, chunks(), self.sample_rate, self.channels)
+        else:
+            process = (
+                ffmpeg.input("pipe:", format="s16le", ar=self.sample_rate, ac=self.channels)
+                .output(output_path)
+                .overwrite_output()
+                .global_args("-loglevel", "error")
+                .run_async(pipe_stdin=True)
+            )
+            try:
+                for data in chunks():
+                    process.stdin.write(data)
+            finally:
+                process.stdin.close()
+                process.wait()
+            if process.returncode:
+                raise RuntimeError(f"ffmpeg failed to encode {output_path} (exit {process.returncode})")
+        seconds = written / (SAMPLE_WIDTH * self.channels * self.sample_rate)
+        logger.info(f"Rendered {len(self.placements)} segments, {seconds:.1f}s to {output_path}")
+        return lengths
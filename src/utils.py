@@ -1,5 +1,7 @@
 import json
 import os
+import threading
+import unicodedata
 from typing import Any, List, Union
 
 from logger import logger
@@ -32,13 +34,29 @@ def read(file_path: str, verbose: bool = False):
 
 def write(file_path: str, data: Any, verbose: bool = True):
     logger.info(f"Writing to file: {file_path}")
+    # Unique per writer, so concurrent writes of the same file never share a temp file.
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     if file_path.endswith(".json"):
-        with open(file_path, "w", encoding="utf-8") as f:
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
     elif file_path.endswith(".txt"):
-        with open(file_path, "w", encoding="utf-8") as f:
+        with open(tmp_path, "w", encoding="utf-8") as f:
             print(data, file=f)
     else:
         logger.error(f"File type not supported: {file_path}")
         raise ValueError(f"File type not supported: {file_path}")
+    os.replace(tmp_path, file_path)
     print(f"Wrote to {file_path}") if verbose else None
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question or post, used to key caches and to compare
+    near duplicates: NFC, casefolded, no punctuation
+    (including the Devanagari danda) or zero-width characters, single spaces."""
+    question = unicodedata.normalize("NFC", question).casefold()
+    question = "".join(
+        " " if unicodedata.category(ch).startswith("P") else ch
+        for ch in question
+        if unicodedata.category(ch) != "Cf"
+    )
+    return " ".join(question.split())